@@ -537,8 +537,7 @@ class AgentLoop:
             final_content = "Background task completed."
 
         user_content = f"[System: {msg.sender_id}] {msg.content}"
-        session.add_message("user", user_content)
-        session.add_message("assistant", final_content)
+        session.add_messages([("user", user_content), ("assistant", final_content)])
 
         if self.honcho_active:
             self._honcho_sync(session_key, user_content, final_content)
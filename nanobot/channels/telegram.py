@@ -3,6 +3,7 @@
 from __future__ import annotations
 
 import asyncio
+import functools
 import re
 from loguru import logger
 from telegram import BotCommand, Update
@@ -15,65 +16,133 @@ from nanobot.channels.base import BaseChannel
 from nanobot.config.schema import TelegramConfig
 
 
+# Patterns for _markdown_to_telegram_html, compiled once rather than on every message
+_FENCE_INFO_RE = re.compile(r'[\w]*\n?')  # language tag and newline after an opening ```
+_INLINE_CODE_RE = re.compile(r'`([^`]+)`')
+_HEADER_RE = re.compile(r'^#{1,6}\s+(.+)$', re.MULTILINE)
+_QUOTE_RE = re.compile(r'^>\s*(.*)$', re.MULTILINE)
+_LINK_RE = re.compile(r'\[([^\]]+)\]\(([^)]+)\)')
+_BOLD_STAR_RE = re.compile(r'\*\*(.+?)\*\*')
+_BOLD_UNDERSCORE_RE = re.compile(r'__(.+?)__')
+_ITALIC_RE = re.compile(r'(?<![a-zA-Z0-9])_([^_]+)_(?![a-zA-Z0-9])')
+_STRIKE_RE = re.compile(r'~~(.+?)~~')
+_BULLET_RE = re.compile(r'^[-*]\s+', re.MULTILINE)
+# Placeholders open with \x00 and close with \x01, so adjacent ones can't be misread as
+# one spanning the boundary (e.g. the text "IC01" right after a code block's slot)
+_INLINE_CODE_SLOT_RE = re.compile(r'\x00IC(\d+)\x01')
+_CODE_BLOCK_SLOT_RE = re.compile(r'\x00CB(\d+)\x01')
+# Every pass needs at least one of these characters to match anything
+_MARKDOWN_MARKERS = "`#>]_*~-"
+
+
+def _escape_html(text: str) -> str:
+    return text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+
+
+def _fill_slots(slot_re: re.Pattern, text: str, snippets: list[str], template: str) -> str:
+    """Swap placeholders for their escaped snippets; text that only looks like one stays as-is."""
+    def fill(m: re.Match) -> str:
+        i = int(m.group(1))
+        if i >= len(snippets) or m.group(1) != str(i):
+            return m.group(0)
+        return template.format(_escape_html(snippets[i]))
+
+    return slot_re.sub(fill, text)
+
+
+def _extract_code_blocks(text: str, code_blocks: list[str]) -> str:
+    r"""
+    Replace ```fenced``` blocks with placeholders, collecting their contents.
+
+    Matches what the regex ```[\w]*\n?([\s\S]*?)``` would, but locates fences
+    with str.find: that regex backtracked quadratically on an unclosed fence
+    followed by a long word.
+    """
+    parts: list[str] = []
+    pos = 0
+    while (start := text.find("```", pos)) != -1:
+        body = _FENCE_INFO_RE.match(text, start + 3).end()
+        end = text.find("```", body)
+        if end == -1:
+            break
+        code_blocks.append(text[body:end])
+        parts.append(text[pos:start])
+        parts.append(f"\x00CB{len(code_blocks) - 1}\x01")
+        pos = end + 3
+    parts.append(text[pos:])
+    return "".join(parts)
+
+
+@functools.lru_cache(maxsize=256)
 def _markdown_to_telegram_html(text: str) -> str:
     """
     Convert markdown to Telegram-safe HTML.
+
+    Each pass only runs when its marker characters occur in the text, so plain
+    messages (the common case) skip most of the regex work. Results are cached
+    per chunk, so resending the same content skips the conversion entirely.
     """
     if not text:
         return ""
     
+    # Plain text: nothing for any pass to match, only escaping applies
+    if not any(c in text for c in _MARKDOWN_MARKERS):
+        return _escape_html(text)
+    
     # 1. Extract and protect code blocks (preserve content from other processing)
     code_blocks: list[str] = []
-    def save_code_block(m: re.Match) -> str:
-        code_blocks.append(m.group(1))
-        return f"\x00CB{len(code_blocks) - 1}\x00"
-    
-    text = re.sub(r'```[\w]*\n?([\s\S]*?)```', save_code_block, text)
+    if "```" in text:
+        text = _extract_code_blocks(text, code_blocks)
     
     # 2. Extract and protect inline code
     inline_codes: list[str] = []
     def save_inline_code(m: re.Match) -> str:
         inline_codes.append(m.group(1))
-        return f"\x00IC{len(inline_codes) - 1}\x00"
+        return f"\x00IC{len(inline_codes) - 1}\x01"
     
-    text = re.sub(r'`([^`]+)`', save_inline_code, text)
+    if "`" in text:
+        text = _INLINE_CODE_RE.sub(save_inline_code, text)
     
     # 3. Headers # Title -> just the title text
-    text = re.sub(r'^#{1,6}\s+(.+)$', r'\1', text, flags=re.MULTILINE)
+    if "#" in text:
+        text = _HEADER_RE.sub(r'\1', text)
     
     # 4. Blockquotes > text -> just the text (before HTML escaping)
-    text = re.sub(r'^>\s*(.*)$', r'\1', text, flags=re.MULTILINE)
+    if ">" in text:
+        text = _QUOTE_RE.sub(r'\1', text)
     
     # 5. Escape HTML special characters
-    text = text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+    text = _escape_html(text)
     
     # 6. Links [text](url) - must be before bold/italic to handle nested cases
-    text = re.sub(r'\[([^\]]+)\]\(([^)]+)\)', r'<a href="\2">\1</a>', text)
+    if "](" in text:
+        text = _LINK_RE.sub(r'<a href="\2">\1</a>', text)
     
     # 7. Bold **text** or __text__
-    text = re.sub(r'\*\*(.+?)\*\*', r'<b>\1</b>', text)
-    text = re.sub(r'__(.+?)__', r'<b>\1</b>', text)
+    if "**" in text:
+        text = _BOLD_STAR_RE.sub(r'<b>\1</b>', text)
+    if "__" in text:
+        text = _BOLD_UNDERSCORE_RE.sub(r'<b>\1</b>', text)
     
     # 8. Italic _text_ (avoid matching inside words like some_var_name)
-    text = re.sub(r'(?<![a-zA-Z0-9])_([^_]+)_(?![a-zA-Z0-9])', r'<i>\1</i>', text)
+    if "_" in text:
+        text = _ITALIC_RE.sub(r'<i>\1</i>', text)
     
     # 9. Strikethrough ~~text~~
-    text = re.sub(r'~~(.+?)~~', r'<s>\1</s>', text)
+    if "~~" in text:
+        text = _STRIKE_RE.sub(r'<s>\1</s>', text)
     
     # 10. Bullet lists - item -> • item
-    text = re.sub(r'^[-*]\s+', '• ', text, flags=re.MULTILINE)
+    if "-" in text or "*" in text:
+        text = _BULLET_RE.sub('• ', text)
     
-    # 11. Restore inline code with HTML tags
-    for i, code in enumerate(inline_codes):
-        # Escape HTML in code content
-        escaped = code.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
-        text = text.replace(f"\x00IC{i}\x00", f"<code>{escaped}</code>")
+    # 11. Restore inline code with HTML tags (one pass over the text, not one per snippet)
+    if inline_codes:
+        text = _fill_slots(_INLINE_CODE_SLOT_RE, text, inline_codes, "<code>{}</code>")
     
     # 12. Restore code blocks with HTML tags
-    for i, code in enumerate(code_blocks):
-        # Escape HTML in code content
-        escaped = code.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
-        text = text.replace(f"\x00CB{i}\x00", f"<pre><code>{escaped}</code></pre>")
+    if code_blocks:
+        text = _fill_slots(_CODE_BLOCK_SLOT_RE, text, code_blocks, "<pre><code>{}</code></pre>")
     
     return text
 
@@ -82,22 +151,34 @@ def _split_message(content: str, max_len: int = 4000) -> list[str]:
     """Split content into chunks within max_len, preferring line breaks."""
     if len(content) <= max_len:
         return [content]
+    # Walk a cursor through the text rather than re-slicing the remainder each round
     chunks: list[str] = []
-    while content:
-        if len(content) <= max_len:
-            chunks.append(content)
+    start, end = 0, len(content)
+    while start < end:
+        if end - start <= max_len:
+            chunks.append(content[start:])
             break
-        cut = content[:max_len]
-        pos = cut.rfind('\n')
+        limit = start + max_len
+        pos = content.rfind('\n', start, limit)
         if pos == -1:
-            pos = cut.rfind(' ')
+            pos = content.rfind(' ', start, limit)
         if pos == -1:
-            pos = max_len
-        chunks.append(content[:pos])
-        content = content[pos:].lstrip()
+            pos = limit
+        chunks.append(content[start:pos])
+        start = pos
+        while start < end and content[start].isspace():
+            start += 1
     return chunks
 
 
+# File extensions for downloaded media: by MIME type first, then by Telegram media type
+_MIME_EXTENSIONS = {
+    "image/jpeg": ".jpg", "image/png": ".png", "image/gif": ".gif",
+    "audio/ogg": ".ogg", "audio/mpeg": ".mp3", "audio/mp4": ".m4a",
+}
+_MEDIA_TYPE_EXTENSIONS = {"image": ".jpg", "voice": ".ogg", "audio": ".mp3", "file": ""}
+
+
 class TelegramChannel(BaseChannel):
     """
     Telegram channel using long polling.
@@ -125,7 +206,7 @@ class TelegramChannel(BaseChannel):
         self.groq_api_key = groq_api_key
         self._app: Application | None = None
         self._chat_ids: dict[str, int] = {}  # Map sender_id to chat_id for replies
-        self._typing_tasks: dict[str, asyncio.Task] = {}  # chat_id -> typing loop task
+        self._typing_tasks: dict[int, asyncio.Task] = {}  # chat_id -> typing loop task
     
     async def start(self) -> None:
         """Start the Telegram bot with long polling."""
@@ -204,14 +285,14 @@ class TelegramChannel(BaseChannel):
             logger.warning("Telegram bot not running")
             return
 
-        self._stop_typing(msg.chat_id)
-
         try:
             chat_id = int(msg.chat_id)
         except ValueError:
             logger.error(f"Invalid chat_id: {msg.chat_id}")
             return
 
+        self._stop_typing(chat_id)
+
         for chunk in _split_message(msg.content):
             try:
                 html = _markdown_to_telegram_html(chunk)
@@ -329,15 +410,13 @@ class TelegramChannel(BaseChannel):
         
         logger.debug(f"Telegram message from {sender_id}: {content[:50]}...")
         
-        str_chat_id = str(chat_id)
-        
         # Start typing indicator before processing
-        self._start_typing(str_chat_id)
+        self._start_typing(chat_id)
         
         # Forward to the message bus
         await self._handle_message(
             sender_id=sender_id,
-            chat_id=str_chat_id,
+            chat_id=str(chat_id),
             content=content,
             media=media_paths,
             metadata={
@@ -349,23 +428,23 @@ class TelegramChannel(BaseChannel):
             }
         )
     
-    def _start_typing(self, chat_id: str) -> None:
+    def _start_typing(self, chat_id: int) -> None:
         """Start sending 'typing...' indicator for a chat."""
         # Cancel any existing typing task for this chat
         self._stop_typing(chat_id)
         self._typing_tasks[chat_id] = asyncio.create_task(self._typing_loop(chat_id))
     
-    def _stop_typing(self, chat_id: str) -> None:
+    def _stop_typing(self, chat_id: int) -> None:
         """Stop the typing indicator for a chat."""
         task = self._typing_tasks.pop(chat_id, None)
         if task and not task.done():
             task.cancel()
     
-    async def _typing_loop(self, chat_id: str) -> None:
+    async def _typing_loop(self, chat_id: int) -> None:
         """Repeatedly send 'typing' action until cancelled."""
         try:
             while self._app:
-                await self._app.bot.send_chat_action(chat_id=int(chat_id), action="typing")
+                await self._app.bot.send_chat_action(chat_id=chat_id, action="typing")
                 await asyncio.sleep(4)
         except asyncio.CancelledError:
             pass
@@ -376,15 +455,7 @@ class TelegramChannel(BaseChannel):
         """Log polling / handler errors instead of silently swallowing them."""
         logger.error(f"Telegram error: {context.error}")
 
-    def _get_extension(self, media_type: str, mime_type: str | None) -> str:
+    @staticmethod
+    def _get_extension(media_type: str, mime_type: str | None) -> str:
         """Get file extension based on media type."""
-        if mime_type:
-            ext_map = {
-                "image/jpeg": ".jpg", "image/png": ".png", "image/gif": ".gif",
-                "audio/ogg": ".ogg", "audio/mpeg": ".mp3", "audio/mp4": ".m4a",
-            }
-            if mime_type in ext_map:
-                return ext_map[mime_type]
-        
-        type_map = {"image": ".jpg", "voice": ".ogg", "audio": ".mp3", "file": ""}
-        return type_map.get(media_type, "")
+        return _MIME_EXTENSIONS.get(mime_type) or _MEDIA_TYPE_EXTENSIONS.get(media_type, "")
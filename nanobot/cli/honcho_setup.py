@@ -334,8 +334,7 @@ def _migrate_sessions() -> int:
             key = path.stem.replace("_", ":", 1)
 
             session = mgr.get_or_create(key)
-            for msg in messages:
-                session.add_message(msg["role"], msg["content"])
+            session.add_messages((msg["role"], msg["content"]) for msg in messages)
             mgr.save(session)
 
             # Archive the old file
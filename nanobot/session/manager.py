@@ -4,7 +4,7 @@ import json
 from pathlib import Path
 from dataclasses import dataclass, field
 from datetime import datetime
-from typing import Any
+from typing import Any, Iterable
 
 from loguru import logger
 
@@ -40,6 +40,16 @@ class Session:
         }
         self.messages.append(msg)
         self.updated_at = datetime.now()
+
+    def add_messages(self, messages: Iterable[tuple[str, str]]) -> None:
+        """Add several (role, content) messages at once, sharing one timestamp."""
+        now = datetime.now()
+        timestamp = now.isoformat()
+        self.messages.extend(
+            {"role": role, "content": content, "timestamp": timestamp}
+            for role, content in messages
+        )
+        self.updated_at = now
     
     def get_history(self, max_messages: int = 500) -> list[dict[str, Any]]:
         """Get recent messages in LLM format (role + content only)."""
@@ -7,12 +7,22 @@ Usage:
     uv run scratch/droplets/deploy-honcho.py
 """
 
+import base64
+import gzip
+import io
 import json
 import os
+import random
 import shutil
 import subprocess
 import sys
+import tarfile
+import tempfile
 import time
+import urllib.error
+import urllib.request
+from dataclasses import dataclass
+from typing import NoReturn
 
 DROPLET_NAME = "nb-honcho"
 REPO = "https://github.com/plastic-labs/nanobot-honcho.git"
@@ -21,49 +31,111 @@ WORKSPACE_ID = "nanobot-test-honcho"
 REGION = "nyc1"
 SIZE = "s-1vcpu-1gb"
 IMAGE = "ubuntu-24-04-x64"
-
-PROVIDERS = [
-    # (config_name, env_var, default_model, description, help_url)
-    ("openrouter",  "OPENROUTER_API_KEY",  "anthropic/claude-sonnet-4-5",      "gateway -- any model",  "https://openrouter.ai/keys"),
-    ("anthropic",   "ANTHROPIC_API_KEY",   "anthropic/claude-sonnet-4-5",      "Claude models",         "https://console.anthropic.com"),
-    ("openai",      "OPENAI_API_KEY",      "openai/gpt-4o",                    "GPT models",            "https://platform.openai.com/api-keys"),
-    ("deepseek",    "DEEPSEEK_API_KEY",    "deepseek/deepseek-chat",           "DeepSeek models",       "https://platform.deepseek.com"),
-    ("gemini",      "GEMINI_API_KEY",      "gemini/gemini-2.0-flash",          "Google Gemini",         "https://aistudio.google.com/apikey"),
-    ("groq",        "GROQ_API_KEY",        "groq/llama-3.3-70b-versatile",    "fast inference",        "https://console.groq.com/keys"),
-]
+NANOBOT_BIN = "/root/nanobot/.venv/bin/nanobot"
+
+@dataclass(frozen=True, slots=True)
+class ProviderSpec:
+    env: str            # env var holding the API key
+    default_model: str
+    desc: str
+    url: str            # where to get a key
+
+PROVIDERS = {
+    "openrouter": ProviderSpec("OPENROUTER_API_KEY",  "anthropic/claude-sonnet-4-5",    "gateway -- any model",  "https://openrouter.ai/keys"),
+    "anthropic":  ProviderSpec("ANTHROPIC_API_KEY",   "anthropic/claude-sonnet-4-5",    "Claude models",         "https://console.anthropic.com"),
+    "openai":     ProviderSpec("OPENAI_API_KEY",      "openai/gpt-4o",                  "GPT models",            "https://platform.openai.com/api-keys"),
+    "deepseek":   ProviderSpec("DEEPSEEK_API_KEY",    "deepseek/deepseek-chat",         "DeepSeek models",       "https://platform.deepseek.com"),
+    "gemini":     ProviderSpec("GEMINI_API_KEY",      "gemini/gemini-2.0-flash",        "Google Gemini",         "https://aistudio.google.com/apikey"),
+    "groq":       ProviderSpec("GROQ_API_KEY",        "groq/llama-3.3-70b-versatile",   "fast inference",        "https://console.groq.com/keys"),
+}
 
 # filled by choose_provider / choose_model
 PROVIDER = {}  # {"name": ..., "env": ..., "key": ..., "model": ...}
 
 
 def run(cmd, check=True, capture=False, **kw):
-    return subprocess.run(cmd, check=check, capture_output=capture, text=True, **kw)
+    kw.setdefault("text", True)
+    return subprocess.run(cmd, check=check, capture_output=capture, **kw)
+
+def run_async(cmd, **kw):
+    # start cmd in the background (off the tty, output captured); collect it with join()
+    return subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                            text=True, **kw)
+
+def join(proc, check=True):
+    out, err = proc.communicate()
+    if check and proc.returncode != 0:
+        raise subprocess.CalledProcessError(proc.returncode, proc.args, out, err)
+    return subprocess.CompletedProcess(proc.args, proc.returncode, out, err)
+
+BOLD, DIM, RED, GREEN, YELLOW, RESET = "\033[1m", "\033[2m", "\033[31m", "\033[32m", "\033[33m", "\033[0m"
+
+def info(msg: str) -> None: print(f"{BOLD}>> {msg}{RESET}")
+def ok(msg: str) -> None: print(f"   {GREEN}{msg}{RESET}")
+def warn(msg: str) -> None: print(f"   {YELLOW}{msg}{RESET}")
+def fail(msg: str) -> NoReturn: print(f"   {RED}{msg}{RESET}"); sys.exit(1)
+def dim(msg: str) -> None: print(f"   {DIM}{msg}{RESET}")
 
-def info(msg): print(f"\033[1m>> {msg}\033[0m")
-def ok(msg): print(f"   \033[32m{msg}\033[0m")
-def warn(msg): print(f"   \033[33m{msg}\033[0m")
-def fail(msg): print(f"   \033[31m{msg}\033[0m"); sys.exit(1)
-def dim(msg): print(f"   \033[2m{msg}\033[0m")
+# secrets the deploy reads: snapshotted from os.environ once at startup, then filled
+# in by CLI flags and prompts
+ENV = {}
+INTERACTIVE = True  # False with --non-interactive or no tty: missing values fail instead of prompting
+
+def snapshot_env():
+    names = {spec.env for spec in PROVIDERS.values()} | {"TELEGRAM_BOT_TOKEN", "HONCHO_API_KEY"}
+    ENV.update({name: os.environ.get(name, "") for name in names})
+
+def set_var(name, val):
+    ENV[name] = os.environ[name] = val
 
 def ensure_var(name, prompt, help_text=""):
-    val = os.environ.get(name, "")
+    val = ENV.get(name, "")
     if val:
         dim(f"{name} set from environment")
         return val
+    if not INTERACTIVE: fail(f"{name} not set (pass it as a flag or in the environment)")
     if help_text: dim(help_text)
     val = input(f"   {prompt}: ").strip()
     if not val: fail("Value required")
-    os.environ[name] = val
+    set_var(name, val)
     return val
 
-def ssh(ip, cmd, check=True):
-    return run(["ssh", "-o", "StrictHostKeyChecking=no", "-o", "ConnectTimeout=10",
-                f"root@{ip}", cmd], check=check, capture=True)
+def ssh(ip, cmd, check=True, stdin=None, connect_timeout=10, stream=False):
+    # stdin is piped straight to the remote command, so file payloads never
+    # pass through a heredoc (no shell quoting, no EOF-marker collisions).
+    # calls share one multiplexed connection: the first success (wait_for_ssh's probe)
+    # becomes the master and later calls skip the TCP + key exchange handshake.
+    # stream=True leaves stdout/stderr on the terminal so output shows as it arrives
+    return run(["ssh", "-o", "StrictHostKeyChecking=no", "-o", f"ConnectTimeout={connect_timeout}",
+                "-o", "ControlMaster=auto", "-o", "ControlPath=/tmp/nb-ssh-%r@%h:%p", "-o", "ControlPersist=60s",
+                f"root@{ip}", cmd], check=check, capture=not stream, input=stdin,
+               text=not isinstance(stdin, bytes))
+
+def tar_files(files):
+    # {remote_path: (text, mode)} -> tar stream to unpack with `tar -x -C /`; only file
+    # members are added, so existing remote directories keep their ownership and modes
+    buf = io.BytesIO()
+    with tarfile.open(fileobj=buf, mode="w") as tar:
+        for path, (text, mode) in files.items():
+            data = text.encode()
+            member = tarfile.TarInfo(path.lstrip("/"))
+            member.size, member.mode, member.mtime = len(data), mode, int(time.time())
+            tar.addfile(member, io.BytesIO(data))
+    return buf.getvalue()
 
 def ssh_ok(ip, cmd):
-    r = ssh(ip, cmd, check=False)
+    # readiness probe: fail fast so backoff() sets the pace, not the connect timeout
+    r = ssh(ip, cmd, check=False, connect_timeout=2)
     return r.returncode == 0
 
+def backoff(timeout, cap=15):
+    # yields seconds elapsed, sleeping 1s, 2s, 4s, ... (capped, plus jitter) in between, until timeout
+    start, delay = time.monotonic(), 1.0
+    while (elapsed := time.monotonic() - start) < timeout:
+        yield elapsed
+        time.sleep(delay + random.uniform(0, 0.5))
+        delay = min(delay * 2, cap)
+
 
 # -- setup ------------------------------------------------------------------
 
@@ -74,9 +146,11 @@ def ensure_doctl():
         return
     fail("doctl not found. Install: brew install doctl && doctl auth init")
 
-def ensure_doctl_auth():
+ACCOUNT_GET = ["doctl", "account", "get"]
+
+def ensure_doctl_auth(pending=None):
     info("Checking doctl auth")
-    r = run(["doctl", "account", "get"], check=False, capture=True)
+    r = join(pending, check=False) if pending else run(ACCOUNT_GET, check=False, capture=True)
     if r.returncode == 0:
         ok("authenticated")
         return
@@ -84,21 +158,27 @@ def ensure_doctl_auth():
     dim("Run: doctl auth init")
     fail("doctl auth required")
 
-def get_ssh_key_id():
+_cache = {}  # doctl lookups already done this run
+SSH_KEY_LIST = ["doctl", "compute", "ssh-key", "list", "--output", "json"]
+
+def get_ssh_key_id(pending=None):
     info("Finding SSH key")
-    r = run(["doctl", "compute", "ssh-key", "list", "--format", "ID,Name", "--no-header"], capture=True)
-    lines = r.stdout.strip().split("\n")
-    if not lines or not lines[0].strip():
+    if "ssh_key_id" in _cache:
+        ok(f"using {_cache['ssh_key_id']} (cached)")
+        return _cache["ssh_key_id"]
+    r = join(pending) if pending else run(SSH_KEY_LIST, capture=True)
+    keys = json.loads(r.stdout or "[]")
+    if not keys:
         fail("No SSH keys found in your DO account. Add one: doctl compute ssh-key import")
-    key_id = lines[0].split()[0]
-    key_name = " ".join(lines[0].split()[1:])
+    key_id, key_name = str(keys[0]["id"]), keys[0]["name"]
     ok(f"using {key_name} ({key_id})")
+    _cache["ssh_key_id"] = key_id
     return key_id
 
 def choose_provider():
     info("Provider")
-    for i, (name, _env, _model, desc, url) in enumerate(PROVIDERS, 1):
-        print(f"   {i}. {name:<14} {desc:<24} {url}")
+    for i, (name, spec) in enumerate(PROVIDERS.items(), 1):
+        print(f"   {i}. {name:<14} {spec.desc:<24} {spec.url}")
     choice = input("   Select provider [1]: ").strip() or "1"
     try:
         idx = int(choice) - 1
@@ -106,13 +186,15 @@ def choose_provider():
             raise ValueError
     except ValueError:
         fail(f"Invalid choice: {choice}")
-    name, env, default_model, desc, url = PROVIDERS[idx]
-    PROVIDER["name"] = name
-    PROVIDER["env"] = env
-    PROVIDER["default_model"] = default_model
-    PROVIDER["url"] = url
+    name = list(PROVIDERS)[idx]
+    use_provider(name)
     ok(f"{name}")
 
+def use_provider(name):
+    spec = PROVIDERS[name]
+    PROVIDER.update({"name": name, "env": spec.env, "default_model": spec.default_model, "url": spec.url})
+    return spec
+
 def choose_model():
     info("Model")
     default = PROVIDER["default_model"]
@@ -128,104 +210,183 @@ def collect_keys():
     ensure_var("TELEGRAM_BOT_TOKEN", "Telegram bot token", "@BotFather on Telegram -> /newbot")
     ensure_var("HONCHO_API_KEY", "Honcho API key", "https://app.honcho.dev")
 
+# cheap authenticated GETs per provider, with the status codes that mean the key itself is
+# bad (Gemini answers an invalid key with 400 API_KEY_INVALID); a bad key is caught long
+# before a droplet would have been created, installed and restarted with it
+KEY_CHECKS = {
+    "openrouter": ("https://openrouter.ai/api/v1/auth/key", (401,)),
+    "anthropic":  ("https://api.anthropic.com/v1/models", (401,)),
+    "openai":     ("https://api.openai.com/v1/models", (401,)),
+    "deepseek":   ("https://api.deepseek.com/models", (401,)),
+    "gemini":     ("https://generativelanguage.googleapis.com/v1beta/models", (400, 401)),
+    "groq":       ("https://api.groq.com/openai/v1/models", (401,)),
+}
+
+def key_rejected(url, headers, bad_codes):
+    # True only for a status in bad_codes; any other error, network trouble or a malformed
+    # url (a stray character in the token) can't say either way, so warn and return False
+    host = url.split("/")[2]
+    req = urllib.request.Request(url, headers={"User-Agent": "nanobot-deploy", **headers})
+    try:
+        urllib.request.urlopen(req, timeout=3).close()
+    except urllib.error.HTTPError as e:
+        if e.code in bad_codes:
+            return True
+        warn(f"{host} answered {e.code}, skipping check")
+    except (urllib.error.URLError, OSError, ValueError):
+        dim(f"could not reach {host}, skipping check")
+    return False
+
+def validate_credentials():
+    info("Validating credentials")
+    name, key = PROVIDER["name"], PROVIDER["key"]
+    headers = ({"x-api-key": key, "anthropic-version": "2023-06-01"} if name == "anthropic"
+               else {"x-goog-api-key": key} if name == "gemini" else {"Authorization": f"Bearer {key}"})
+    url, bad_codes = KEY_CHECKS.get(name, (None, ()))
+    if url and key_rejected(url, headers, bad_codes):
+        fail(f"{name} API key rejected ({PROVIDER['url']})")
+    # getMe answers a wrong token with 401 and a malformed one with 404
+    if key_rejected(f"https://api.telegram.org/bot{ENV['TELEGRAM_BOT_TOKEN']}/getMe", {}, (401, 404)):
+        fail("Telegram bot token rejected (@BotFather on Telegram -> /token)")
+    ok("provider key and bot token accepted")
+
 
 # -- droplet ----------------------------------------------------------------
 
-def get_droplet_ip():
-    r = run(["doctl", "compute", "droplet", "get", DROPLET_NAME, "--format", "PublicIPv4", "--no-header"],
-            check=False, capture=True)
-    if r.returncode == 0 and r.stdout.strip():
-        return r.stdout.strip()
-    return None
+DROPLET_LIST = ["doctl", "compute", "droplet", "list", "--output", "json"]
 
-def create_droplet(ssh_key_id):
+def get_droplet_ip(pending=None):
+    # one list call filtered locally; main starts it alongside the auth and key lookups so
+    # the existence check costs no extra wait. Polls pass nothing and list afresh
+    r = join(pending, check=False) if pending else run(DROPLET_LIST, check=False, capture=True)
+    if r.returncode != 0 or not r.stdout.strip():
+        return None
+    return public_ip([d for d in json.loads(r.stdout) or [] if d["name"] == DROPLET_NAME])
+
+def public_ip(droplets):
+    # first public v4 address in doctl's droplet JSON (a list); None until one is assigned
+    nets = (droplets[0]["networks"].get("v4") or []) if droplets else []
+    return next((net["ip_address"] for net in nets if net["type"] == "public"), None)
+
+def create_droplet(ssh_key_id, provision, droplet_list=None):
+    # returns (ip, created); user-data only runs on first boot, so an existing droplet
+    # is always provisioned over ssh
     info(f"Creating droplet: {DROPLET_NAME}")
-    existing_ip = get_droplet_ip()
+    existing_ip = get_droplet_ip(droplet_list)
     if existing_ip:
         ok(f"already exists ({existing_ip})")
-        return existing_ip
+        return existing_ip, False
 
+    # the Ubuntu image (or a snapshot built from it) already has python3, git and curl, and
+    # uv brings its own venv support: only go to apt if a tool is missing, and skip the uv
+    # install when the image has it baked in. A snapshot of a deployed droplet carries its
+    # old markers, so clear them first or the wait and service check would see stale ones
     cloud_init = """#!/bin/bash
-apt-get update -qq
-apt-get install -y -qq git curl python3 python3-pip python3-venv > /dev/null 2>&1
-curl -LsSf https://astral.sh/uv/install.sh | sh
-touch /root/.cloud-init-done
+rm -f /root/.cloud-init-done /root/.cloud-init-done.tmp /root/.provision-failed
+command -v git > /dev/null && command -v curl > /dev/null || \\
+  { apt-get update -qq && apt-get install -y -qq --no-install-recommends git curl > /dev/null 2>&1; }
+[ -x /root/.local/bin/uv ] || curl -LsSf https://astral.sh/uv/install.sh | sh
 """
-    # Write cloud-init to temp file
-    init_path = "/tmp/nb-cloud-init.yaml"
-    with open(init_path, "w") as f:
+    if provision:
+        # clone, install and start the service while the droplet boots; config (secrets
+        # included) rides along as a gzipped tar in the user-data. Note the droplet's
+        # metadata endpoint (169.254.169.254) serves user-data to any local process
+        bundle = base64.b64encode(gzip.compress(tar_files(config_files()))).decode()
+        steps = ["export HOME=/root", "mkdir -p /root/.nanobot/workspace",
+                 f"echo {bundle} | base64 -d | tar -xz -C /", sync_repo(REPO, BRANCH, "/root/nanobot"), *install_steps()]
+        # chained with &&: set -e is ignored in a subshell on the left of ||, so it would not
+        # stop at a failed step or mark the run as failed
+        cloud_init += "(\n" + " &&\n".join(steps) + "\n) > /root/.provision.log 2>&1 || touch /root/.provision-failed\n"
+    # written last, so it also marks the end of provisioning; written to a temp file and
+    # renamed so the poller never reads a half-written marker
+    cloud_init += "/root/.local/bin/uv --version > /root/.cloud-init-done.tmp && mv /root/.cloud-init-done.tmp /root/.cloud-init-done\n"
+    # per-run temp file (mode 0600, since the user-data carries the config bundle)
+    with tempfile.NamedTemporaryFile("w", prefix="nb-cloud-init-", suffix=".yaml", delete=False) as f:
         f.write(cloud_init)
-
-    run(["doctl", "compute", "droplet", "create", DROPLET_NAME,
-         "--region", REGION, "--size", SIZE, "--image", IMAGE,
-         "--ssh-keys", ssh_key_id, "--user-data-file", init_path,
-         "--wait"])
-
-    ip = None
-    for _ in range(30):
-        ip = get_droplet_ip()
-        if ip: break
-        time.sleep(2)
+    init_path = f.name
+    try:
+        r = run(["doctl", "compute", "droplet", "create", DROPLET_NAME,
+                 "--region", REGION, "--size", SIZE, "--image", IMAGE,
+                 "--ssh-keys", ssh_key_id, "--user-data-file", init_path,
+                 "--wait", "--output", "json"], check=False, capture=True)
+    finally:
+        os.unlink(init_path)
+    if r.returncode != 0:
+        print(r.stderr)
+        fail("droplet create failed")
+    # --wait returns once the droplet is active, so its JSON normally carries the address
+    # already; only look it up again (at most 3 times, backing off) if it doesn't
+    ip = public_ip(json.loads(r.stdout or "[]"))
+    if not ip:
+        for _ in zip(range(3), backoff(60)):
+            ip = get_droplet_ip()
+            if ip: break
     if not ip:
         fail("Could not get droplet IP")
     ok(f"created ({ip})")
-    return ip
+    return ip, True
 
 def wait_for_ssh(ip):
     info("Waiting for SSH")
-    for i in range(30):
+    for elapsed in backoff(180):
         if ssh_ok(ip, "echo ok"):
             ok("connected")
             return
-        time.sleep(5)
-        if i % 3 == 0: dim(f"waiting... ({(i+1)*5}s)")
+        if elapsed: dim(f"waiting... ({elapsed:.0f}s)")
     fail("SSH timeout")
 
 def wait_for_cloud_init(ip):
     info("Waiting for cloud-init")
-    for i in range(60):
-        if ssh_ok(ip, "test -f /root/.cloud-init-done"):
-            ok("done")
+    for elapsed in backoff(600):
+        # the marker holds `uv --version`, so one probe covers both cloud-init and uv
+        r = ssh(ip, "cat /root/.cloud-init-done", check=False, connect_timeout=2)
+        if r.returncode == 0:
+            if r.stdout.strip(): ok(f"done ({r.stdout.strip()})")
+            else: warn("done, but uv is missing")
             return
-        time.sleep(5)
-        if i % 3 == 0: dim(f"waiting... ({(i+1)*5}s)")
+        if elapsed: dim(f"waiting... ({elapsed:.0f}s)")
     warn("cloud-init may not have finished, continuing anyway")
 
 
 # -- deploy -----------------------------------------------------------------
 
+def sync_repo(repo, branch, dest):
+    # shell snippet: on redeploy fetch only the branch tip into the existing checkout and
+    # reset to it (leaves the untracked .venv alone); fresh shallow clone if there is no repo
+    return (f"if git -C {dest} fetch -q --depth 1 {repo} {branch} 2>/dev/null"
+            f" && git -C {dest} reset -q --hard FETCH_HEAD; then echo updated; "
+            f"else rm -rf {dest} && git clone -q --branch {branch} --single-branch --depth 1 {repo} {dest}"
+            f" && echo cloned; fi")
+
 def clone_repo(ip):
     info(f"Cloning {REPO} @ {BRANCH}")
-    ssh(ip, f"rm -rf /root/nanobot && git clone --branch {BRANCH} --single-branch --depth 1 {REPO} /root/nanobot")
-    ok("cloned")
-
-def install_nanobot(ip):
-    info("Installing nanobot")
-    ssh(ip, "export PATH=/root/.local/bin:$PATH && cd /root/nanobot && uv venv /root/nanobot/.venv && uv pip install --no-cache -e .")
-    nanobot_bin = "/root/nanobot/.venv/bin/nanobot"
-    r = ssh(ip, f"test -x {nanobot_bin} && echo ok", check=False)
-    if r.stdout.strip() != "ok":
-        fail(f"nanobot binary not found at {nanobot_bin}")
-    ok(f"installed ({nanobot_bin})")
-    return nanobot_bin
+    r = ssh(ip, sync_repo(REPO, BRANCH, "/root/nanobot"))
+    ok(r.stdout.strip())
 
-def write_config(ip):
-    info("Writing config")
+def config_files():
+    # {remote_path: (text, mode)} for config.json, .env and the unit; shipped over ssh by
+    # write_config, or baked into cloud-init for a new droplet
     config = {
         "providers": {PROVIDER["name"]: {"apiKey": PROVIDER["key"]}},
         "agents": {"defaults": {"model": PROVIDER["model"]}},
-        "channels": {"telegram": {"enabled": True, "token": os.environ["TELEGRAM_BOT_TOKEN"], "allowFrom": []}},
+        "channels": {"telegram": {"enabled": True, "token": ENV["TELEGRAM_BOT_TOKEN"], "allowFrom": []}},
         "honcho": {"enabled": True, "workspaceId": WORKSPACE_ID, "prefetch": True},
         "tools": {"exec": {"timeout": 60}},
     }
-    config_json = json.dumps(config, indent=2)
-    ssh(ip, f"mkdir -p /root/.nanobot/workspace && cat > /root/.nanobot/config.json << 'ENDJSON'\n{config_json}\nENDJSON")
-    ssh(ip, f"echo 'HONCHO_API_KEY={os.environ['HONCHO_API_KEY']}' > /root/.nanobot/.env")
-    ok(f"config.json + .env written ({PROVIDER['name']}/{PROVIDER['model']})")
-
-def setup_service(ip, nanobot_bin):
-    info("Setting up systemd service")
-    unit = f"""[Unit]
+    return {
+        "/root/.nanobot/config.json": (json.dumps(config, separators=(",", ":")) + "\n", 0o600),
+        "/root/.nanobot/.env": (f"HONCHO_API_KEY={ENV['HONCHO_API_KEY']}\n", 0o600),
+        "/etc/systemd/system/nanobot.service": (service_unit(), 0o644),
+    }
+
+def write_config(ip):
+    info("Writing config")
+    # rendered locally and shipped as raw bytes in a single ssh round-trip
+    ssh(ip, "mkdir -p /root/.nanobot/workspace && tar -x -C /", stdin=tar_files(config_files()))
+    ok(f"config.json, .env, nanobot.service written ({PROVIDER['name']}/{PROVIDER['model']})")
+
+def service_unit():
+    return f"""[Unit]
 Description=nanobot gateway
 After=network.target
 
@@ -233,7 +394,7 @@ After=network.target
 Type=simple
 EnvironmentFile=/root/.nanobot/.env
 Environment=PATH=/root/nanobot/.venv/bin:/root/.local/bin:/usr/local/bin:/usr/bin:/bin
-ExecStart={nanobot_bin} gateway --port 8080
+ExecStart={NANOBOT_BIN} gateway --port 8080
 WorkingDirectory=/root
 Restart=always
 RestartSec=5
@@ -241,20 +402,66 @@ RestartSec=5
 [Install]
 WantedBy=multi-user.target
 """
-    ssh(ip, f"cat > /etc/systemd/system/nanobot.service << 'EOF'\n{unit}EOF")
-    ssh(ip, "systemctl daemon-reload && systemctl enable nanobot && systemctl restart nanobot")
-    time.sleep(3)
-    r = ssh(ip, "systemctl is-active nanobot", check=False)
-    if r.stdout.strip() == "active":
-        ok("service running")
+
+# polled on the droplet after restart: the unit has to stay active for ~3s; on the first
+# non-active poll print its status and exit 3 (distinct from install errors)
+SERVICE_CHECK = ("for i in 1 2 3; do sleep 1; systemctl is-active -q nanobot || "
+                 "{ systemctl is-active nanobot; exit 3; }; done")
+
+def show_journal(ip):
+    # streamed straight to the terminal rather than captured and printed afterwards
+    ssh(ip, "journalctl -u nanobot --no-pager -n 20", check=False, stream=True)
+
+def install_steps():
+    # remote commands taking a synced checkout (config and unit already on disk) to a
+    # started service; run over ssh by install_nanobot or by cloud-init on a new droplet
+    return [
+        "export PATH=/root/nanobot/.venv/bin:/root/.local/bin:$PATH",
+        "cd /root/nanobot",
+        "uv venv --allow-existing /root/nanobot/.venv",
+        "uv pip install --no-cache -e .",
+        f"test -x {NANOBOT_BIN}",
+        "systemctl daemon-reload",
+        "systemctl enable nanobot",
+        "systemctl restart nanobot",
+    ]
+
+def install_nanobot(ip):
+    info("Installing nanobot + starting service")
+    # one round-trip: config and unit are already on disk, so install and start together
+    r = ssh(ip, " && ".join([*install_steps(), SERVICE_CHECK]), check=False)
+    if r.returncode == 3:
+        # install output may precede it: the status is the last line
+        status = r.stdout.strip().rpartition("\n")[2]
+        ok(f"installed ({NANOBOT_BIN})")
+        warn(f"service status: {status}")
+        show_journal(ip)
+    elif r.returncode != 0:
+        print(r.stderr)
+        fail(f"install failed (expected binary at {NANOBOT_BIN})")
     else:
-        warn(f"service status: {r.stdout.strip()}")
-        r2 = ssh(ip, "journalctl -u nanobot --no-pager -n 20", check=False)
-        print(r2.stdout)
+        ok(f"installed ({NANOBOT_BIN}), service running")
+
+def check_service(ip):
+    info("Checking service (provisioned by cloud-init)")
+    r = ssh(ip, f"if [ -e /root/.provision-failed ]; then tail -n 20 /root/.provision.log; exit 4; fi; {SERVICE_CHECK}",
+            check=False)
+    if r.returncode == 4:
+        print(r.stdout)
+        fail("provisioning failed (full log: /root/.provision.log); rerun with --legacy-ssh")
+    if r.returncode == 3:
+        status = r.stdout.strip().rpartition("\n")[2]
+        warn(f"service status: {status}")
+        show_journal(ip)
+    elif r.returncode != 0:
+        print(r.stderr)
+        fail("service check failed")
+    else:
+        ok(f"installed ({NANOBOT_BIN}), service running")
 
 def summary(ip):
     print()
-    print(f"\033[1m== {DROPLET_NAME} deployed ==\033[0m")
+    print(f"{BOLD}== {DROPLET_NAME} deployed =={RESET}")
     print(f"   IP:        {ip}")
     print(f"   Branch:    {BRANCH}")
     print(f"   Provider:  {PROVIDER['name']}")
@@ -271,37 +478,53 @@ def summary(ip):
 if __name__ == "__main__":
     import argparse
     p = argparse.ArgumentParser()
-    p.add_argument("--provider", help="Provider name (openrouter, anthropic, openai, deepseek, gemini, groq)")
+    p.add_argument("--provider", help=f"Provider name ({', '.join(PROVIDERS)})")
     p.add_argument("--provider-key", help="API key for the chosen provider")
     p.add_argument("--model", help="Model identifier (e.g. anthropic/claude-sonnet-4-5)")
     p.add_argument("--telegram-token"); p.add_argument("--honcho-key")
+    p.add_argument("--legacy-ssh", action="store_true",
+                   help="Provision over ssh after boot instead of via cloud-init (existing droplets always use ssh)")
+    p.add_argument("--image", default=IMAGE,
+                   help=f"Droplet image slug or snapshot id, e.g. one with uv preinstalled (default: {IMAGE})")
+    p.add_argument("--non-interactive", action="store_true",
+                   help="Never prompt; fail if a value is missing (implied when stdin is not a tty)")
     args = p.parse_args()
+    INTERACTIVE = not args.non_interactive and sys.stdin.isatty()
+    IMAGE = args.image
 
     # Pre-fill from CLI args
+    snapshot_env()
     if args.provider:
-        match = [p for p in PROVIDERS if p[0] == args.provider]
-        if not match: fail(f"Unknown provider: {args.provider}")
-        name, env, default_model, desc, url = match[0]
-        PROVIDER.update({"name": name, "env": env, "default_model": default_model, "url": url})
-        if args.provider_key: os.environ[env] = args.provider_key; PROVIDER["key"] = args.provider_key
-        PROVIDER["model"] = args.model or default_model
-    if args.telegram_token: os.environ["TELEGRAM_BOT_TOKEN"] = args.telegram_token
-    if args.honcho_key: os.environ["HONCHO_API_KEY"] = args.honcho_key
+        if args.provider not in PROVIDERS: fail(f"Unknown provider: {args.provider}")
+        spec = use_provider(args.provider)
+        if args.provider_key: set_var(spec.env, args.provider_key); PROVIDER["key"] = args.provider_key
+        PROVIDER["model"] = args.model or spec.default_model
+    if args.telegram_token: set_var("TELEGRAM_BOT_TOKEN", args.telegram_token)
+    if args.honcho_key: set_var("HONCHO_API_KEY", args.honcho_key)
 
     ensure_doctl()
-    ensure_doctl_auth()
-    ssh_key_id = get_ssh_key_id()
+    # the doctl queries are independent API round-trips: start them together, and let the
+    # key and droplet lookups keep running while the user answers prompts
+    account = run_async(ACCOUNT_GET)
+    ssh_key_list = run_async(SSH_KEY_LIST)
+    droplet_list = run_async(DROPLET_LIST)
+    ensure_doctl_auth(account)
 
     if not PROVIDER.get("name"):
+        if not INTERACTIVE: fail("--provider is required when not running interactively")
         choose_provider()
         choose_model()
     collect_keys()
+    validate_credentials()
+    ssh_key_id = get_ssh_key_id(ssh_key_list)
 
-    ip = create_droplet(ssh_key_id)
+    ip, created = create_droplet(ssh_key_id, provision=not args.legacy_ssh, droplet_list=droplet_list)
     wait_for_ssh(ip)
     wait_for_cloud_init(ip)
-    clone_repo(ip)
-    nanobot_bin = install_nanobot(ip)
-    write_config(ip)
-    setup_service(ip, nanobot_bin)
+    if created and not args.legacy_ssh:
+        check_service(ip)
+    else:
+        clone_repo(ip)
+        write_config(ip)
+        install_nanobot(ip)
     summary(ip)
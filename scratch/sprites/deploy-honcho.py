@@ -9,29 +9,43 @@ Usage:
     uv run scratch/sprites/deploy-honcho.py
 """
 
+import base64
+import hashlib
 import json
 import os
+import select
 import shutil
 import subprocess
 import sys
-from getpass import getpass
+import time
+from dataclasses import dataclass
 
 SPRITE_NAME = "nb-honcho"
 REPO = "https://github.com/plastic-labs/nanobot-honcho.git"
 BRANCH = "honcho-default"
 WORKSPACE_ID = "nanobot-test-honcho"
 NANOBOT_BIN = ""
+SHELL = None  # open SpriteShell, set inside main's `with SpriteShell()`
+STATE_FILE = os.path.expanduser("~/.cache/nanobot-deploy/state.json")
 
-PROVIDERS = [
-    ("openrouter",  "OPENROUTER_API_KEY",  "anthropic/claude-sonnet-4-5",      "gateway -- any model",  "https://openrouter.ai/keys"),
-    ("anthropic",   "ANTHROPIC_API_KEY",   "anthropic/claude-sonnet-4-5",      "Claude models",         "https://console.anthropic.com"),
-    ("openai",      "OPENAI_API_KEY",      "openai/gpt-4o",                    "GPT models",            "https://platform.openai.com/api-keys"),
-    ("deepseek",    "DEEPSEEK_API_KEY",    "deepseek/deepseek-chat",           "DeepSeek models",       "https://platform.deepseek.com"),
-    ("gemini",      "GEMINI_API_KEY",      "gemini/gemini-2.0-flash",          "Google Gemini",         "https://aistudio.google.com/apikey"),
-    ("groq",        "GROQ_API_KEY",        "groq/llama-3.3-70b-versatile",    "fast inference",        "https://console.groq.com/keys"),
-]
+@dataclass(frozen=True, slots=True)
+class ProviderSpec:
+    env: str            # env var holding the API key
+    default_model: str
+    desc: str
+    url: str            # where to get a key
+
+PROVIDERS = {
+    "openrouter": ProviderSpec("OPENROUTER_API_KEY",  "anthropic/claude-sonnet-4-5",    "gateway -- any model",  "https://openrouter.ai/keys"),
+    "anthropic":  ProviderSpec("ANTHROPIC_API_KEY",   "anthropic/claude-sonnet-4-5",    "Claude models",         "https://console.anthropic.com"),
+    "openai":     ProviderSpec("OPENAI_API_KEY",      "openai/gpt-4o",                  "GPT models",            "https://platform.openai.com/api-keys"),
+    "deepseek":   ProviderSpec("DEEPSEEK_API_KEY",    "deepseek/deepseek-chat",         "DeepSeek models",       "https://platform.deepseek.com"),
+    "gemini":     ProviderSpec("GEMINI_API_KEY",      "gemini/gemini-2.0-flash",        "Google Gemini",         "https://aistudio.google.com/apikey"),
+    "groq":       ProviderSpec("GROQ_API_KEY",        "groq/llama-3.3-70b-versatile",   "fast inference",        "https://console.groq.com/keys"),
+}
 
 PROVIDER = {}
+_VAR_CACHE = {}  # values already resolved by ensure_var
 
 
 def run(cmd, check=True, capture=False, **kw):
@@ -40,8 +54,74 @@ def run(cmd, check=True, capture=False, **kw):
 def sprite(*args, check=True):
     return run(["sprite", *args], check=check)
 
-def sprite_exec(script, check=True):
-    return sprite("exec", "bash", "-c", script, check=check)
+def sprite_exec(script, check=True, capture=False):
+    if SHELL: return SHELL.run(script, check=check, capture=capture)
+    return run(["sprite", "exec", "bash", "-c", script], check=check, capture=capture)
+
+def write_file(path, text):
+    # shell fragment writing text to path; base64 keeps the payload opaque to the remote shell
+    return f"echo {base64.b64encode(text.encode()).decode()} | base64 -d > {path}"
+
+class SpriteBatch:
+    """Queue shell fragments and run them under `set -e` in one `sprite exec` round-trip."""
+    def __init__(self):
+        self.frags = []
+
+    def add(self, script):
+        self.frags.append(script)
+
+    def flush(self, label):
+        if not self.frags: return None
+        info(f"Running {label} ({len(self.frags)} steps, one sprite exec)")
+        script = "\n".join(["set -e", *self.frags])
+        self.frags = []
+        r = sprite_exec(script)
+        ok("done")
+        return r
+
+class SpriteShell:
+    """One long-lived `sprite exec bash` for the whole deploy. Each script runs in a child
+    bash fed over stdin and reports its exit status on a sentinel line, so later execs
+    skip the control-channel setup. Falls back to one exec per script if the session
+    doesn't answer."""
+    SENTINEL = "__nanobot_deploy_rc__"
+
+    def __enter__(self):
+        global SHELL
+        self.proc = subprocess.Popen(["sprite", "exec", "bash"], stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+        self.proc.stdin.write(f"echo {self.SENTINEL}0\n"); self.proc.stdin.flush()
+        ready, _, _ = select.select([self.proc.stdout], [], [], 30)
+        if ready and self.proc.stdout.readline().startswith(self.SENTINEL):
+            SHELL = self
+        else:
+            dim("persistent sprite session unavailable, using one exec per step")
+            self.proc.kill()
+        return self
+
+    def __exit__(self, *exc):
+        global SHELL
+        SHELL = None
+        if self.proc.poll() is None:
+            self.proc.stdin.close()
+            self.proc.wait()
+
+    def run(self, script, check=True, capture=False):
+        # script as an argument, not on the inner bash's stdin, so a step reading stdin
+        # (onboard's overwrite prompt) can't swallow the rest of it
+        self.proc.stdin.write(f'bash -c "$(echo {base64.b64encode(script.encode()).decode()} | base64 -d)" </dev/null; '
+                              f"echo {self.SENTINEL}$?\n")
+        self.proc.stdin.flush()
+        out, rc = [], None
+        for line in self.proc.stdout:
+            text, hit, tail = line.partition(self.SENTINEL)
+            if capture: out.append(text)
+            else: print(text, end="", flush=True)
+            if hit:
+                rc = int(tail)
+                break
+        if rc is None: fail("sprite exec session closed unexpectedly")
+        if check and rc: raise subprocess.CalledProcessError(rc, "sprite exec", "".join(out))
+        return subprocess.CompletedProcess("sprite exec", rc, "".join(out) if capture else None)
 
 def info(msg): print(f"\033[1m>> {msg}\033[0m")
 def ok(msg): print(f"   \033[32m{msg}\033[0m")
@@ -50,21 +130,47 @@ def fail(msg): print(f"   \033[31m{msg}\033[0m"); sys.exit(1)
 def dim(msg): print(f"   \033[2m{msg}\033[0m")
 
 def ensure_var(name, prompt, help_text=""):
+    val = _VAR_CACHE.get(name)
+    if val: return val
     val = os.environ.get(name, "")
     if val:
         dim(f"{name} set from environment")
-        return val
-    if help_text: dim(help_text)
-    val = input(f"   {prompt}: ").strip()
-    if not val: fail("Value required")
-    os.environ[name] = val
+    else:
+        if help_text: dim(help_text)
+        val = input(f"   {prompt}: ").strip()
+        if not val: fail("Value required")
+        os.environ[name] = val
+    _VAR_CACHE[name] = val
     return val
 
+def cached_probe(key, fn, ttl=300):
+    # Reuse a probe result for ttl seconds, as long as the sprite binary is unchanged.
+    # fn returns None for results that must not be cached (e.g. not logged in).
+    path = shutil.which("sprite") or ""
+    cli = f"{path}:{os.stat(path).st_mtime_ns}" if path else ""
+    try:
+        with open(STATE_FILE) as f: state = json.load(f)
+    except (OSError, ValueError):
+        state = {}
+    hit = state.get(key)
+    if hit and hit.get("cli") == cli and time.time() - hit.get("at", 0) < ttl:
+        return hit["value"]
+    value = fn()
+    if value is not None:
+        state[key] = {"cli": cli, "at": time.time(), "value": value}
+        os.makedirs(os.path.dirname(STATE_FILE), exist_ok=True)
+        with open(STATE_FILE, "w") as f: json.dump(state, f)
+    return value
+
+def sprite_version():
+    r = run(["sprite", "version"], capture=True, check=False)
+    return r.stdout.strip() if r.returncode == 0 else None
+
 def ensure_sprite_cli():
     info("Checking sprite CLI")
     if shutil.which("sprite"):
-        r = run(["sprite", "version"], capture=True, check=False)
-        ok(f"found ({r.stdout.strip()})" if r.returncode == 0 else "found")
+        version = cached_probe("version", sprite_version)
+        ok(f"found ({version})" if version else "found")
         return
     warn("sprite CLI not found -- installing")
     run(["sh", "-c", "curl -fsSL https://sprites.dev/install.sh | sh"])
@@ -76,8 +182,7 @@ def ensure_sprite_cli():
 
 def ensure_sprite_login():
     info("Checking sprite auth")
-    r = sprite("list", check=False)
-    if r.returncode == 0:
+    if cached_probe("auth", lambda: "ok" if sprite("list", check=False).returncode == 0 else None):
         ok("authenticated")
         return
     warn("Not logged in")
@@ -89,8 +194,8 @@ def ensure_sprite_login():
 
 def choose_provider():
     info("Provider")
-    for i, (name, _env, _model, desc, url) in enumerate(PROVIDERS, 1):
-        print(f"   {i}. {name:<14} {desc:<24} {url}")
+    for i, (name, spec) in enumerate(PROVIDERS.items(), 1):
+        print(f"   {i}. {name:<14} {spec.desc:<24} {spec.url}")
     choice = input("   Select provider [1]: ").strip() or "1"
     try:
         idx = int(choice) - 1
@@ -98,13 +203,15 @@ def choose_provider():
             raise ValueError
     except ValueError:
         fail(f"Invalid choice: {choice}")
-    name, env, default_model, desc, url = PROVIDERS[idx]
-    PROVIDER["name"] = name
-    PROVIDER["env"] = env
-    PROVIDER["default_model"] = default_model
-    PROVIDER["url"] = url
+    name = list(PROVIDERS)[idx]
+    use_provider(name)
     ok(f"{name}")
 
+def use_provider(name):
+    spec = PROVIDERS[name]
+    PROVIDER.update({"name": name, "env": spec.env, "default_model": spec.default_model, "url": spec.url})
+    return spec
+
 def choose_model():
     info("Model")
     default = PROVIDER["default_model"]
@@ -126,62 +233,75 @@ def create_sprite():
     ok("created" if r.returncode == 0 else "already exists")
     sprite("use", SPRITE_NAME)
 
-def clone_repo():
+def clone_repo(batch):
     info(f"Cloning {REPO} @ {BRANCH}")
-    sprite_exec(f"rm -rf /home/sprite/nanobot && git clone --branch {BRANCH} --single-branch --depth 1 {REPO} /home/sprite/nanobot")
-    ok("cloned")
+    batch.add(f"rm -rf /home/sprite/nanobot && git -c protocol.version=2 clone --branch {BRANCH} --single-branch --depth 1 --no-tags {REPO} /home/sprite/nanobot")
+    ok("queued")
 
-def install_uv():
+def install_uv(batch):
     info("Installing uv on sprite")
-    r = sprite_exec("command -v uv >/dev/null 2>&1 || ~/.local/bin/uv --version >/dev/null 2>&1", check=False)
-    if r.returncode == 0:
-        ok("already installed")
-        return
-    sprite_exec("curl -LsSf https://astral.sh/uv/install.sh | sh")
-    ok("installed")
+    batch.add("command -v uv >/dev/null 2>&1 || ~/.local/bin/uv --version >/dev/null 2>&1 "
+              "|| curl -LsSf https://astral.sh/uv/install.sh | sh")
+    ok("queued")
 
-def install_nanobot():
+def install_nanobot(batch):
     global NANOBOT_BIN
     info("Installing nanobot")
-    sprite_exec("export PATH=$HOME/.local/bin:$PATH && cd /home/sprite/nanobot && uv pip install --system --no-cache -e .")
-    r = run(["sprite", "exec", "bash", "-c",
-             "export PATH=$HOME/.local/bin:$PATH && python3 -c \"import shutil; print(shutil.which('nanobot'))\""],
-            capture=True, check=False)
-    NANOBOT_BIN = r.stdout.strip() if r.returncode == 0 and r.stdout.strip() else ""
-    if not NANOBOT_BIN:
-        r2 = run(["sprite", "exec", "bash", "-c",
-                  "find /.sprite/languages -name nanobot -type f 2>/dev/null | head -1"],
-                 capture=True, check=False)
-        NANOBOT_BIN = r2.stdout.strip() if r2.returncode == 0 else "nanobot"
+    # keep uv's wheel cache on the sprite so redeploys skip the downloads
+    batch.add("export PATH=$HOME/.local/bin:$PATH UV_CACHE_DIR=/home/sprite/.cache/uv && cd /home/sprite/nanobot && uv pip install --system --compile-bytecode -e .")
+    # resolving the binary parses output, so everything queued so far runs now
+    batch.flush("clone + install")
+    # one round-trip: PATH lookup, falling back to a search of the sprite language installs
+    r = sprite_exec("export PATH=$HOME/.local/bin:$PATH && "
+                    "{ command -v nanobot || find /.sprite/languages -name nanobot -type f 2>/dev/null | head -1; }",
+                    check=False, capture=True)
+    NANOBOT_BIN = r.stdout.strip() or "nanobot"
     ok(f"installed ({NANOBOT_BIN})")
 
-def write_config():
+def write_config(batch):
     info("Writing config")
+    # secrets live only in .env (picked up through nanobot's NANOBOT_* settings overrides),
+    # so config.json stays the same across key rotations
+    env = {
+        "HONCHO_API_KEY": os.environ["HONCHO_API_KEY"],
+        f"NANOBOT_PROVIDERS__{PROVIDER['name'].upper()}__API_KEY": PROVIDER["key"],
+        "NANOBOT_CHANNELS__TELEGRAM__TOKEN": os.environ["TELEGRAM_BOT_TOKEN"],
+    }
     config = {
-        "providers": {PROVIDER["name"]: {"apiKey": PROVIDER["key"]}},
         "agents": {"defaults": {"model": PROVIDER["model"]}},
-        "channels": {"telegram": {"enabled": True, "token": os.environ["TELEGRAM_BOT_TOKEN"], "allowFrom": []}},
+        "channels": {"telegram": {"enabled": True, "allowFrom": []}},
         "honcho": {"enabled": True, "workspaceId": WORKSPACE_ID, "prefetch": True},
         "tools": {"exec": {"timeout": 60}},
     }
-    config_json = json.dumps(config, indent=2)
-    sprite_exec("mkdir -p /home/sprite/.nanobot/workspace")
-    sprite_exec(f"cat > /home/sprite/.nanobot/config.json << 'ENDJSON'\n{config_json}\nENDJSON")
-    sprite_exec(f"echo 'HONCHO_API_KEY={os.environ['HONCHO_API_KEY']}' > /home/sprite/.nanobot/.env")
-    ok(f"config.json + .env written ({PROVIDER['name']}/{PROVIDER['model']})")
+    config_json = json.dumps(config, separators=(",", ":"))
+    batch.add("mkdir -p /home/sprite/.nanobot/workspace")
+    # config.json holds no secrets, so on a redeploy it is usually unchanged; onboard and
+    # `honcho enable` rewrite the file in their own format, so compare against a sidecar
+    # holding the sha of what we last uploaded rather than hashing config.json itself
+    config_sha = hashlib.sha256(config_json.encode()).hexdigest()
+    r = sprite_exec("[ -f /home/sprite/.nanobot/config.json ] && cat /home/sprite/.nanobot/.config-sha256", check=False, capture=True)
+    if r.returncode == 0 and r.stdout.strip() == config_sha:
+        dim("config.json unchanged on sprite, not re-uploading")
+    else:
+        batch.add(write_file("/home/sprite/.nanobot/config.json", config_json))
+        batch.add(write_file("/home/sprite/.nanobot/.config-sha256", config_sha + "\n"))
+    batch.add(write_file("/home/sprite/.nanobot/.env", "".join(f"{k}={v}\n" for k, v in env.items())))
+    ok(f"config queued ({PROVIDER['name']}/{PROVIDER['model']})")
 
-def onboard():
+def onboard(batch):
     info("Running onboard")
-    sprite_exec(f"export HOME=/home/sprite && {NANOBOT_BIN} onboard 2>/dev/null || true")
-    ok("done")
+    # config.json was just written, so onboard asks whether to overwrite it: answer N
+    # (refresh, keeping our values) so it goes on to create the workspace templates
+    batch.add(f"export HOME=/home/sprite && printf 'n\\n' | {NANOBOT_BIN} onboard > /dev/null")
+    ok("queued")
 
-def register_service():
+def register_service(batch):
     info("Registering nanobot service")
     startup = f"#!/bin/bash\nset -a\nsource /home/sprite/.nanobot/.env\nset +a\nexport HOME=/home/sprite\nexec {NANOBOT_BIN} gateway --port 8080\n"
-    sprite_exec(f"cat > /home/sprite/start-nanobot.sh << 'STARTSH'\n{startup}STARTSH\nchmod +x /home/sprite/start-nanobot.sh")
-    sprite("exec", "sprite-env", "services", "create", "nanobot",
-           "--cmd", "bash", "--args", "/home/sprite/start-nanobot.sh", check=False)
-    sprite("exec", "sprite-env", "services", "start", "nanobot", check=False)
+    batch.add(write_file("/home/sprite/start-nanobot.sh", startup) + " && chmod +x /home/sprite/start-nanobot.sh")
+    batch.add("sprite-env services create nanobot --cmd bash --args /home/sprite/start-nanobot.sh || true")
+    batch.add("sprite-env services start nanobot || true")
+    batch.flush("config + onboard + service")
     sprite("url", "update", "--auth", "public", check=False)
     ok("service started")
 
@@ -202,19 +322,17 @@ def summary():
 if __name__ == "__main__":
     import argparse
     p = argparse.ArgumentParser()
-    p.add_argument("--provider", help="Provider name (openrouter, anthropic, openai, deepseek, gemini, groq)")
+    p.add_argument("--provider", help=f"Provider name ({', '.join(PROVIDERS)})")
     p.add_argument("--provider-key", help="API key for the chosen provider")
     p.add_argument("--model", help="Model identifier (e.g. anthropic/claude-sonnet-4-5)")
     p.add_argument("--telegram-token"); p.add_argument("--honcho-key")
     args = p.parse_args()
 
     if args.provider:
-        match = [p for p in PROVIDERS if p[0] == args.provider]
-        if not match: fail(f"Unknown provider: {args.provider}")
-        name, env, default_model, desc, url = match[0]
-        PROVIDER.update({"name": name, "env": env, "default_model": default_model, "url": url})
-        if args.provider_key: os.environ[env] = args.provider_key; PROVIDER["key"] = args.provider_key
-        PROVIDER["model"] = args.model or default_model
+        if args.provider not in PROVIDERS: fail(f"Unknown provider: {args.provider}")
+        spec = use_provider(args.provider)
+        if args.provider_key: os.environ[spec.env] = args.provider_key; PROVIDER["key"] = args.provider_key
+        PROVIDER["model"] = args.model or spec.default_model
     if args.telegram_token: os.environ["TELEGRAM_BOT_TOKEN"] = args.telegram_token
     if args.honcho_key: os.environ["HONCHO_API_KEY"] = args.honcho_key
 
@@ -226,10 +344,12 @@ if __name__ == "__main__":
         choose_model()
     collect_keys()
     create_sprite()
-    clone_repo()
-    install_uv()
-    install_nanobot()
-    write_config()
-    onboard()
-    register_service()
+    with SpriteShell():
+        batch = SpriteBatch()
+        clone_repo(batch)
+        install_uv(batch)
+        install_nanobot(batch)
+        write_config(batch)
+        onboard(batch)
+        register_service(batch)
     summary()
@@ -11,32 +11,49 @@ Usage:
     uv run scratch/deploy-vanilla.py --openrouter-key sk-or-... --telegram-token 123:ABC --honcho-key hch-...
 """
 
+import base64
+import hashlib
 import json
 import os
+import select
 import shutil
 import subprocess
 import sys
-from getpass import getpass
+import time
+from dataclasses import dataclass
 
 SPRITE_NAME = "nb-vanilla"
 VANILLA_REPO = "https://github.com/HKUDS/nanobot.git"
 VANILLA_BRANCH = "main"
 SKILL_REPO = "https://github.com/plastic-labs/nanobot-honcho.git"
 SKILL_BRANCH = "honcho-default"
+# the skill source is only read from, so fetch a plain tarball instead of a git checkout
+SKILL_TARBALL = f"{SKILL_REPO.removesuffix('.git')}/archive/refs/heads/{SKILL_BRANCH}.tar.gz"
 WORKSPACE_ID = "nanobot-test-vanilla"
 TRACE_LOG = "/home/sprite/skill-apply-trace.log"
+SKILL_HASH_FILE = "/home/sprite/.nanobot/.skill-hash"
 NANOBOT_BIN = ""
-
-PROVIDERS = [
-    ("openrouter",  "OPENROUTER_API_KEY",  "anthropic/claude-sonnet-4-5",      "gateway -- any model",  "https://openrouter.ai/keys"),
-    ("anthropic",   "ANTHROPIC_API_KEY",   "anthropic/claude-sonnet-4-5",      "Claude models",         "https://console.anthropic.com"),
-    ("openai",      "OPENAI_API_KEY",      "openai/gpt-4o",                    "GPT models",            "https://platform.openai.com/api-keys"),
-    ("deepseek",    "DEEPSEEK_API_KEY",    "deepseek/deepseek-chat",           "DeepSeek models",       "https://platform.deepseek.com"),
-    ("gemini",      "GEMINI_API_KEY",      "gemini/gemini-2.0-flash",          "Google Gemini",         "https://aistudio.google.com/apikey"),
-    ("groq",        "GROQ_API_KEY",        "groq/llama-3.3-70b-versatile",    "fast inference",        "https://console.groq.com/keys"),
-]
+SHELL = None  # open SpriteShell, set inside main's `with SpriteShell()`
+STATE_FILE = os.path.expanduser("~/.cache/nanobot-deploy/state.json")
+
+@dataclass(frozen=True, slots=True)
+class ProviderSpec:
+    env: str            # env var holding the API key
+    default_model: str
+    desc: str
+    url: str            # where to get a key
+
+PROVIDERS = {
+    "openrouter": ProviderSpec("OPENROUTER_API_KEY",  "anthropic/claude-sonnet-4-5",    "gateway -- any model",  "https://openrouter.ai/keys"),
+    "anthropic":  ProviderSpec("ANTHROPIC_API_KEY",   "anthropic/claude-sonnet-4-5",    "Claude models",         "https://console.anthropic.com"),
+    "openai":     ProviderSpec("OPENAI_API_KEY",      "openai/gpt-4o",                  "GPT models",            "https://platform.openai.com/api-keys"),
+    "deepseek":   ProviderSpec("DEEPSEEK_API_KEY",    "deepseek/deepseek-chat",         "DeepSeek models",       "https://platform.deepseek.com"),
+    "gemini":     ProviderSpec("GEMINI_API_KEY",      "gemini/gemini-2.0-flash",        "Google Gemini",         "https://aistudio.google.com/apikey"),
+    "groq":       ProviderSpec("GROQ_API_KEY",        "groq/llama-3.3-70b-versatile",   "fast inference",        "https://console.groq.com/keys"),
+}
 
 PROVIDER = {}
+_VAR_CACHE: dict[str, str] = {}  # values already resolved by ensure_var
 
 
 # ---------------------------------------------------------------------------
@@ -51,8 +68,99 @@ def sprite(*args: str, check: bool = True) -> subprocess.CompletedProcess:
     return run(["sprite", *args], check=check)
 
 
-def sprite_exec(script: str, check: bool = True) -> subprocess.CompletedProcess:
-    return sprite("exec", "bash", "-c", script, check=check)
+def sprite_exec(script: str, check: bool = True, capture: bool = False) -> subprocess.CompletedProcess:
+    if SHELL:
+        return SHELL.run(script, check=check, capture=capture)
+    return run(["sprite", "exec", "bash", "-c", script], check=check, capture=capture)
+
+
+def b64(text: str) -> str:
+    """Encode a payload for `echo ... | base64 -d`: nothing in it is parsed by the remote shell."""
+    return base64.b64encode(text.encode()).decode()
+
+
+def write_file(path: str, text: str) -> str:
+    return f"echo {b64(text)} | base64 -d > {path}"
+
+
+class SpriteBatch:
+    """Queue shell fragments and run them in a single `sprite exec` round-trip.
+
+    Every `sprite exec` pays for a fresh control-channel setup, so steps whose
+    output we don't need to inspect are queued with add() and flushed together
+    at phase boundaries. The batch runs under `set -e`: the first failing
+    fragment stops it, as a failing sprite_exec(check=True) would have.
+    """
+
+    def __init__(self):
+        self.frags: list[str] = []
+
+    def add(self, script: str):
+        self.frags.append(script)
+
+    def flush(self, label: str) -> subprocess.CompletedProcess | None:
+        if not self.frags:
+            return None
+        info(f"Running {label} ({len(self.frags)} steps, one sprite exec)")
+        script = "\n".join(["set -e", *self.frags])
+        self.frags = []
+        r = sprite_exec(script)
+        ok("done")
+        return r
+
+
+class SpriteShell:
+    """One long-lived `sprite exec bash` session for the whole deploy.
+
+    Each script is shipped base64-encoded to a child bash over stdin and reports its
+    exit status on a sentinel line, so only the first exec pays for the control-channel
+    setup. If the session doesn't answer the opening handshake, sprite_exec falls back
+    to one `sprite exec` per script.
+    """
+
+    SENTINEL = "__nanobot_deploy_rc__"
+
+    def __enter__(self) -> "SpriteShell":
+        global SHELL
+        self.proc = subprocess.Popen(["sprite", "exec", "bash"], stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+        self.proc.stdin.write(f"echo {self.SENTINEL}0\n")
+        self.proc.stdin.flush()
+        ready, _, _ = select.select([self.proc.stdout], [], [], 30)
+        if ready and self.proc.stdout.readline().startswith(self.SENTINEL):
+            SHELL = self
+        else:
+            dim("persistent sprite session unavailable, using one exec per step")
+            self.proc.kill()
+        return self
+
+    def __exit__(self, *exc):
+        global SHELL
+        SHELL = None
+        if self.proc.poll() is None:
+            self.proc.stdin.close()
+            self.proc.wait()
+
+    def run(self, script: str, check: bool = True, capture: bool = False) -> subprocess.CompletedProcess:
+        # the script goes in as an argument, not on the inner bash's stdin: a step that reads
+        # stdin (e.g. onboard's overwrite prompt) would otherwise swallow the rest of the script
+        self.proc.stdin.write(f'bash -c "$(echo {b64(script)} | base64 -d)" </dev/null; echo {self.SENTINEL}$?\n')
+        self.proc.stdin.flush()
+        out, rc = [], None
+        for line in self.proc.stdout:
+            # output without a trailing newline shares its last line with the sentinel
+            text, hit, tail = line.partition(self.SENTINEL)
+            if capture:
+                out.append(text)
+            else:
+                print(text, end="", flush=True)
+            if hit:
+                rc = int(tail)
+                break
+        if rc is None:
+            fail("sprite exec session closed unexpectedly")
+        if check and rc:
+            raise subprocess.CalledProcessError(rc, "sprite exec", "".join(out))
+        return subprocess.CompletedProcess("sprite exec", rc, "".join(out) if capture else None)
 
 
 def info(msg: str):
@@ -79,6 +187,8 @@ def dim(msg: str):
 def ask(prompt: str, help_text: str = "", secret: bool = False) -> str:
     if help_text:
         dim(help_text)
+    if secret:
+        from getpass import getpass
     fn = getpass if secret else input
     value = fn(f"   {prompt}: ").strip()
     if not value:
@@ -87,12 +197,16 @@ def ask(prompt: str, help_text: str = "", secret: bool = False) -> str:
 
 
 def ensure_var(name: str, prompt: str, help_text: str = "", secret: bool = False) -> str:
+    val = _VAR_CACHE.get(name)
+    if val:
+        return val
     val = os.environ.get(name, "")
     if val:
         dim(f"{name} set from environment")
-        return val
-    val = ask(prompt, help_text, secret)
-    os.environ[name] = val
+    else:
+        val = ask(prompt, help_text, secret)
+        os.environ[name] = val
+    _VAR_CACHE[name] = val
     return val
 
 
@@ -100,11 +214,41 @@ def ensure_var(name: str, prompt: str, help_text: str = "", secret: bool = False
 # Setup
 # ---------------------------------------------------------------------------
 
+def cached_probe(key: str, fn, ttl: int = 300):
+    """Return fn(), reusing a result cached in STATE_FILE for up to ttl seconds.
+
+    Entries are tied to the sprite binary's path and mtime, so upgrading the CLI
+    invalidates them. fn returns None for results that must not be cached.
+    """
+    path = shutil.which("sprite") or ""
+    cli = f"{path}:{os.stat(path).st_mtime_ns}" if path else ""
+    try:
+        with open(STATE_FILE) as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        state = {}
+    hit = state.get(key)
+    if hit and hit.get("cli") == cli and time.time() - hit.get("at", 0) < ttl:
+        return hit["value"]
+    value = fn()
+    if value is not None:
+        state[key] = {"cli": cli, "at": time.time(), "value": value}
+        os.makedirs(os.path.dirname(STATE_FILE), exist_ok=True)
+        with open(STATE_FILE, "w") as f:
+            json.dump(state, f)
+    return value
+
+
+def sprite_version() -> str | None:
+    r = run(["sprite", "version"], capture=True, check=False)
+    return r.stdout.strip() if r.returncode == 0 else None
+
+
 def ensure_sprite_cli():
     info("Checking sprite CLI")
     if shutil.which("sprite"):
-        r = run(["sprite", "version"], capture=True, check=False)
-        ok(f"found ({r.stdout.strip()})" if r.returncode == 0 else "found")
+        version = cached_probe("version", sprite_version)
+        ok(f"found ({version})" if version else "found")
         return
     warn("sprite CLI not found -- installing")
     run(["sh", "-c", "curl -fsSL https://sprites.dev/install.sh | sh"])
@@ -117,8 +261,7 @@ def ensure_sprite_cli():
 
 def ensure_sprite_login():
     info("Checking sprite auth")
-    r = sprite("list", check=False)
-    if r.returncode == 0:
+    if cached_probe("auth", lambda: "ok" if sprite("list", check=False).returncode == 0 else None):
         ok("authenticated")
         return
     warn("Not logged in")
@@ -133,8 +276,8 @@ def ensure_sprite_login():
 
 def choose_provider():
     info("Provider")
-    for i, (name, _env, _model, desc, url) in enumerate(PROVIDERS, 1):
-        print(f"   {i}. {name:<14} {desc:<24} {url}")
+    for i, (name, spec) in enumerate(PROVIDERS.items(), 1):
+        print(f"   {i}. {name:<14} {spec.desc:<24} {spec.url}")
     choice = input("   Select provider [1]: ").strip() or "1"
     try:
         idx = int(choice) - 1
@@ -142,13 +285,17 @@ def choose_provider():
             raise ValueError
     except ValueError:
         fail(f"Invalid choice: {choice}")
-    name, env, default_model, desc, url = PROVIDERS[idx]
-    PROVIDER["name"] = name
-    PROVIDER["env"] = env
-    PROVIDER["default_model"] = default_model
-    PROVIDER["url"] = url
+    name = list(PROVIDERS)[idx]
+    use_provider(name)
     ok(f"{name}")
 
+
+def use_provider(name: str) -> ProviderSpec:
+    spec = PROVIDERS[name]
+    PROVIDER.update({"name": name, "env": spec.env, "default_model": spec.default_model, "url": spec.url})
+    return spec
+
+
 def choose_model():
     info("Model")
     default = PROVIDER["default_model"]
@@ -176,46 +323,64 @@ def create_sprite():
     sprite("use", SPRITE_NAME)
 
 
-def clone_repos():
+def clone_repos(batch: SpriteBatch):
     info(f"Cloning vanilla nanobot ({VANILLA_REPO} @ {VANILLA_BRANCH})")
-    sprite_exec(f"""
-        rm -rf /home/sprite/nanobot /home/sprite/skill-source
-        git clone --branch {VANILLA_BRANCH} --single-branch --depth 1 {VANILLA_REPO} /home/sprite/nanobot
-    """)
-    ok("cloned vanilla")
-
-    info(f"Cloning skill source ({SKILL_REPO} @ {SKILL_BRANCH})")
-    sprite_exec(f"""
-        git clone --branch {SKILL_BRANCH} --single-branch --depth 1 {SKILL_REPO} /home/sprite/skill-source
+    info(f"Fetching skill source ({SKILL_REPO} @ {SKILL_BRANCH})")
+    # independent downloads: run both in the background and wait on each pid, so the
+    # phase takes as long as the slower one and either failure still stops the batch.
+    # an existing checkout is only moved when upstream has new commits, so an already
+    # patched tree survives a redeploy and apply_skill can skip it
+    batch.add(f"""
+        rm -rf /home/sprite/skill-source
+        mkdir -p /home/sprite/skill-source
+        if [ -d /home/sprite/nanobot/.git ]; then
+            cd /home/sprite/nanobot
+            git -c protocol.version=2 fetch --depth 1 --no-tags origin {VANILLA_BRANCH}
+            [ "$(git rev-parse HEAD)" = "$(git rev-parse FETCH_HEAD)" ] || git reset -q --hard FETCH_HEAD
+        else
+            git -c protocol.version=2 clone --branch {VANILLA_BRANCH} --single-branch --depth 1 --no-tags {VANILLA_REPO} /home/sprite/nanobot
+        fi &
+        NANOBOT_PID=$!
+        curl -fsSL {SKILL_TARBALL} | tar -xz --strip-components=1 -C /home/sprite/skill-source &
+        SKILL_PID=$!
+        wait $NANOBOT_PID
+        wait $SKILL_PID
     """)
-    ok("cloned skill source")
+    ok("queued (parallel)")
 
 
-def apply_skill():
+def apply_skill(batch: SpriteBatch):
     """Patch Honcho support into vanilla nanobot via inline Python on the sprite."""
     info("Applying Honcho skill to vanilla nanobot (with trace logging)")
 
     # The entire patching logic runs as a single Python script on the sprite
     patch_script = r'''
-import os, json, time, subprocess
+import os, json, re, shutil, time, subprocess
 
 NANOBOT = '/home/sprite/nanobot'
 SKILL   = '/home/sprite/skill-source'
-LOG     = '''' + TRACE_LOG + r''''
+LOG     = ''' + repr(TRACE_LOG) + r'''
+
+# one buffered handle for the whole run; phase() flushes at each step boundary
+LOG_FH = open(LOG, 'a', buffering=8192)
 
 def log(msg):
     ts = time.strftime('%H:%M:%S')
     line = f'[{ts}] {msg}'
     print(line)
-    with open(LOG, 'a') as f:
-        f.write(line + '\n')
+    LOG_FH.write(line + '\n')
+
+def phase(title):
+    LOG_FH.flush()
+    log(f'--- {title} ---')
 
 def log_file(path, label):
     log(f'{label}: {path}')
     try:
-        with open(path) as f:
-            content = f.read()
-        log(f'  size: {len(content)} bytes, {content.count(chr(10))} lines')
+        size = os.stat(path).st_size
+        with open(path, 'rb') as f:
+            lines = f.read().count(b'\n')
+        log(f'  size: {size} bytes, {lines} lines')
     except Exception as e:
         log(f'  ERROR reading: {e}')
 
@@ -239,46 +404,67 @@ copies = [
     ('nanobot/skills/honcho/references/session.py',     'nanobot/honcho/session.py'),
     ('nanobot/skills/honcho/references/honcho_tool.py', 'nanobot/agent/tools/honcho.py'),
 ]
+for d in {os.path.dirname(os.path.join(NANOBOT, dst_rel)) for _, dst_rel in copies}:
+    os.makedirs(d, exist_ok=True)
 for src_rel, dst_rel in copies:
     src = os.path.join(SKILL, src_rel)
     dst = os.path.join(NANOBOT, dst_rel)
-    os.makedirs(os.path.dirname(dst), exist_ok=True)
-    with open(src) as f:
-        content = f.read()
-    with open(dst, 'w') as f:
-        f.write(content)
+    shutil.copyfile(src, dst)
     log_file(dst, f'Copied {src_rel}')
 
+# steps 3-6 locate every injection point with a precompiled pattern, collect
+# (offset, text) inserts against the original source and rebuild each file with
+# one join, instead of re-slicing the whole file for every injection. files with
+# several markers use one alternation so they are scanned once
+PP_OPTDEPS_RE = re.compile(r'\[project\.optional-dependencies\]')
+PP_DEV_RE     = re.compile(r'dev = \[[^\]]*\][^\n]*\n')
+SCHEMA_RE     = re.compile(
+    r'(?P<config>class Config\(BaseSettings\):)'
+    r'|(?P<tools>tools: ToolsConfig = Field\(default_factory=ToolsConfig\)[^\n]*)')
+LOOP_RE       = re.compile(
+    r'(?P<param>session_manager: SessionManager \| None = None,)'
+    r'|(?P<attr>self\.restrict_to_workspace = restrict_to_workspace[^\n]*)'
+    r'|(?P<cron>if self\.cron_service:\n {12}self\.tools\.register\(CronTool\(self\.cron_service\)\)[^\n]*)')
+CMD_AGENT_RE  = re.compile(r'restrict_to_workspace=config\.tools\.restrict_to_workspace,')
+
+def scan(pattern, text):
+    found = {}
+    for m in pattern.finditer(text):
+        found.setdefault(m.lastgroup, m)
+    return found
+
+def splice(text, inserts):
+    out, prev = [], 0
+    for pos, ins in sorted(inserts, key=lambda e: e[0]):
+        out += (text[prev:pos], ins)
+        prev = pos
+    out.append(text[prev:])
+    return ''.join(out)
+
 # step 3: patch pyproject.toml
-log('--- Patching pyproject.toml ---')
+phase('Patching pyproject.toml')
 pp_path = os.path.join(NANOBOT, 'pyproject.toml')
 with open(pp_path) as f:
     pp = f.read()
 
 if 'honcho' not in pp:
-    idx = pp.find('[project.optional-dependencies]')
-    if idx == -1:
+    m = PP_OPTDEPS_RE.search(pp)
+    if not m:
         log('  ERROR: [project.optional-dependencies] not found')
     else:
-        idx_dev = pp.find('dev = [', idx)
-        idx_close = pp.find(']', idx_dev) if idx_dev != -1 else -1
-        if idx_close == -1:
+        dev = PP_DEV_RE.search(pp, m.end())
+        if not dev:
             log('  ERROR: could not find dev array end')
         else:
-            pt = idx_close + 1
-            while pt < len(pp) and pp[pt] != '\n':
-                pt += 1
-            pt += 1
             inj = 'honcho = ["honcho-ai>=2.0.1"]\n'
-            pp = pp[:pt] + inj + pp[pt:]
             with open(pp_path, 'w') as f:
-                f.write(pp)
+                f.write(splice(pp, [(dev.end(), inj)]))
             log(f'  Injected: {inj.strip()}')
 else:
     log('  Already has honcho, skipping')
 
 # step 4: patch schema.py
-log('--- Patching schema.py ---')
+phase('Patching schema.py')
 sp = os.path.join(NANOBOT, 'nanobot', 'config', 'schema.py')
 with open(sp) as f:
     s = f.read()
@@ -286,54 +472,47 @@ with open(sp) as f:
 hc_class = '\nclass HonchoConfig(BaseModel):\n    """Honcho AI-native memory integration."""\n    enabled: bool = False\n    workspace_id: str = "nanobot"\n    prefetch: bool = True\n    context_tokens: int | None = None\n    environment: str = "production"\n\n\n'
 
 if 'HonchoConfig' not in s:
-    m = 'class Config(BaseSettings):'
-    i = s.find(m)
-    if i == -1:
+    edits = []
+    found = scan(SCHEMA_RE, s)
+    m = found.get('config')
+    if not m:
         log('  ERROR: Config class not found')
     else:
-        s = s[:i] + hc_class + s[i:]
+        edits.append((m.start(), hc_class))
         log('  Injected HonchoConfig class')
 
-    m2 = 'tools: ToolsConfig = Field(default_factory=ToolsConfig)'
-    i2 = s.find(m2)
-    if i2 == -1:
+    m2 = found.get('tools')
+    if not m2:
         log('  ERROR: tools field not found')
     else:
-        eol = s.find('\n', i2)
-        inj = '\n    honcho: HonchoConfig = Field(default_factory=HonchoConfig)'
-        s = s[:eol] + inj + s[eol:]
+        edits.append((m2.end(), '\n    honcho: HonchoConfig = Field(default_factory=HonchoConfig)'))
         log('  Injected honcho field')
 
     with open(sp, 'w') as f:
-        f.write(s)
+        f.write(splice(s, edits))
 
 # step 5: patch loop.py
-log('--- Patching loop.py ---')
+phase('Patching loop.py')
 lp = os.path.join(NANOBOT, 'nanobot', 'agent', 'loop.py')
 with open(lp) as f:
     l = f.read()
 
 if 'honcho_config' not in l:
-    m = 'session_manager: SessionManager | None = None,'
-    i = l.find(m)
-    if i != -1:
-        e = i + len(m)
-        l = l[:e] + '\n        honcho_config: "HonchoConfig | None" = None,' + l[e:]
+    edits = []
+    found = scan(LOOP_RE, l)
+    m = found.get('param')
+    if m:
+        edits.append((m.end(), '\n        honcho_config: "HonchoConfig | None" = None,'))
         log('  Injected honcho_config param')
 
-    m2 = 'self.restrict_to_workspace = restrict_to_workspace'
-    i2 = l.find(m2)
-    if i2 != -1:
-        e2 = l.find('\n', i2)
-        l = l[:e2] + '\n        self.honcho_config = honcho_config' + l[e2:]
+    m2 = found.get('attr')
+    if m2:
+        edits.append((m2.end(), '\n        self.honcho_config = honcho_config'))
         log('  Injected self.honcho_config')
 
-    m3 = 'if self.cron_service:\n            self.tools.register(CronTool(self.cron_service))'
-    i3 = l.find(m3)
-    if i3 != -1:
-        reg = l.find('self.tools.register(CronTool(self.cron_service))', i3)
-        e3 = l.find('\n', reg)
-        hb = '''
+    m3 = found.get('cron')
+    if m3:
+        hb = """
 
         # Honcho tools (conditional on config + env)
         if self.honcho_config and self.honcho_config.enabled:
@@ -359,83 +538,91 @@ if 'honcho_config' not in l:
                 except ImportError:
                     logger.warning("Honcho enabled but honcho-ai not installed")
                 except Exception as _e:
-                    logger.warning(f"Failed to initialize Honcho: {_e}")'''
-        l = l[:e3] + hb + l[e3:]
+                    logger.warning(f"Failed to initialize Honcho: {_e}")"""
+        edits.append((m3.end(), hb))
         log('  Injected Honcho tool registration')
 
     with open(lp, 'w') as f:
-        f.write(l)
+        f.write(splice(l, edits))
 
 # step 6: patch commands.py
-log('--- Patching commands.py ---')
+phase('Patching commands.py')
 cp = os.path.join(NANOBOT, 'nanobot', 'cli', 'commands.py')
 with open(cp) as f:
     c = f.read()
 
 if 'honcho_config' not in c:
-    mk = 'restrict_to_workspace=config.tools.restrict_to_workspace,'
-    count = 0
-    off = 0
-    while True:
-        i = c.find(mk, off)
-        if i == -1:
-            break
-        e = i + len(mk)
-        inj = '\n        honcho_config=config.honcho,'
-        c = c[:e] + inj + c[e:]
-        off = e + len(inj) + 1
-        count += 1
-        log(f'  Injected honcho_config at AgentLoop #{count}')
+    c, count = CMD_AGENT_RE.subn(r'\g<0>\n        honcho_config=config.honcho,', c)
+    log(f'  Injected honcho_config at {count} AgentLoop sites')
 
     with open(cp, 'w') as f:
         f.write(c)
 
 # step 7: git diff
-log('--- Capturing git diff ---')
+phase('Capturing git diff')
 r = subprocess.run(['git', 'diff', '--stat'], cwd=NANOBOT, capture_output=True, text=True)
 log(f'git diff --stat:\n{r.stdout}')
 
-r2 = subprocess.run(['git', 'diff'], cwd=NANOBOT, capture_output=True, text=True)
-with open(LOG, 'a') as f:
-    f.write('\n=== FULL DIFF ===\n')
-    f.write(r2.stdout)
-    f.write('\n=== END DIFF ===\n')
-log(f'Full diff: {len(r2.stdout)} bytes')
+# git writes the diff straight into the log file; only its size passes through here
+LOG_FH.write('\n=== FULL DIFF ===\n')
+LOG_FH.flush()
+diff_start = os.fstat(LOG_FH.fileno()).st_size
+subprocess.run(['git', 'diff'], cwd=NANOBOT, stdout=LOG_FH)
+diff_size = os.fstat(LOG_FH.fileno()).st_size - diff_start
+LOG_FH.write('\n=== END DIFF ===\n')
+log(f'Full diff: {diff_size} bytes')
 
 log('=== Honcho skill auto-apply completed ===')
+LOG_FH.close()
 '''
 
-    sprite_exec(f"cd /home/sprite && python3 << 'PYEOF'\n{patch_script}\nPYEOF")
-    ok("skill applied")
+    # the marker ties a patched tree to this script, the skill reference files and the
+    # upstream commit; if any of them changed the tree is reset and patched from scratch
+    patch_hash = hashlib.sha256(patch_script.encode()).hexdigest()
+    batch.add(f"""
+        cd /home/sprite/nanobot
+        SKILL_HASH="{patch_hash} $(cat /home/sprite/skill-source/nanobot/skills/honcho/references/*.py | sha256sum | cut -d' ' -f1) $(git rev-parse HEAD)"
+        if [ "$(cat {SKILL_HASH_FILE} 2>/dev/null)" = "$SKILL_HASH" ]; then
+            echo "skill already applied"
+        else
+            git reset -q --hard && git clean -fdq
+            echo {b64(patch_script)} | base64 -d | python3 -
+            mkdir -p "$(dirname {SKILL_HASH_FILE})" && echo "$SKILL_HASH" > {SKILL_HASH_FILE}
+        fi
+    """)
+    ok("queued")
 
 
-def install_uv():
+def install_uv(batch: SpriteBatch):
     info("Installing uv on sprite")
-    r = sprite_exec("command -v uv >/dev/null 2>&1 || ~/.local/bin/uv --version >/dev/null 2>&1", check=False)
-    if r.returncode == 0:
-        ok("already installed")
-        return
-    sprite_exec("curl -LsSf https://astral.sh/uv/install.sh | sh")
-    ok("installed")
+    batch.add("""
+        if command -v uv >/dev/null 2>&1 || ~/.local/bin/uv --version >/dev/null 2>&1; then
+            echo "uv already installed"
+        else
+            curl -LsSf https://astral.sh/uv/install.sh | sh
+        fi
+    """)
+    ok("queued")
 
 
-def install_nanobot():
+def install_nanobot(batch: SpriteBatch):
     global NANOBOT_BIN
     info("Installing nanobot + honcho-ai")
-    sprite_exec("""
+    # keep uv's wheel cache on the sprite so redeploys skip the downloads
+    batch.add("""
         export PATH=$HOME/.local/bin:$PATH
+        export UV_CACHE_DIR=/home/sprite/.cache/uv
         cd /home/sprite/nanobot
-        uv pip install --system --no-cache -e '.[honcho]'
+        uv pip install --system --compile-bytecode -e '.[honcho]'
     """)
-    r = run(["sprite", "exec", "bash", "-c",
-             "export PATH=$HOME/.local/bin:$PATH && python3 -c \"import shutil; print(shutil.which('nanobot'))\""],
-            capture=True, check=False)
-    NANOBOT_BIN = r.stdout.strip() if r.returncode == 0 and r.stdout.strip() else ""
-    if not NANOBOT_BIN:
-        r2 = run(["sprite", "exec", "bash", "-c",
-                  "find /.sprite/languages -name nanobot -type f 2>/dev/null | head -1"],
-                 capture=True, check=False)
-        NANOBOT_BIN = r2.stdout.strip() if r2.returncode == 0 else ""
+    ok("queued")
+    # the binary lookup below parses output, so everything queued so far runs now
+    batch.flush("clone + skill + install")
+    # one round-trip: PATH lookup, falling back to a search of the sprite language installs
+    r = sprite_exec("export PATH=$HOME/.local/bin:$PATH && "
+                    "{ command -v nanobot || find /.sprite/languages -name nanobot -type f 2>/dev/null | head -1; }",
+                    check=False, capture=True)
+    NANOBOT_BIN = r.stdout.strip()
     if NANOBOT_BIN:
         ok(f"installed ({NANOBOT_BIN})")
     else:
@@ -443,15 +630,20 @@ def install_nanobot():
         NANOBOT_BIN = "nanobot"
 
 
-def write_config():
+def write_config(batch: SpriteBatch):
     info("Writing config (honcho enabled)")
+    # secrets live only in .env (picked up through nanobot's NANOBOT_* settings overrides),
+    # so config.json stays the same across key rotations
+    env = {
+        "HONCHO_API_KEY": os.environ["HONCHO_API_KEY"],
+        f"NANOBOT_PROVIDERS__{PROVIDER['name'].upper()}__API_KEY": PROVIDER["key"],
+        "NANOBOT_CHANNELS__TELEGRAM__TOKEN": os.environ["TELEGRAM_BOT_TOKEN"],
+    }
     config = {
-        "providers": {PROVIDER["name"]: {"apiKey": PROVIDER["key"]}},
         "agents": {"defaults": {"model": PROVIDER["model"]}},
         "channels": {
             "telegram": {
                 "enabled": True,
-                "token": os.environ["TELEGRAM_BOT_TOKEN"],
                 "allowFrom": [],
             }
         },
@@ -462,24 +654,38 @@ def write_config():
         },
         "tools": {"exec": {"timeout": 60}},
     }
-    config_json = json.dumps(config, indent=2)
-
-    sprite_exec("mkdir -p /home/sprite/.nanobot/workspace")
-    sprite_exec(f"cat > /home/sprite/.nanobot/config.json << 'ENDJSON'\n{config_json}\nENDJSON")
-    sprite_exec(f"echo 'HONCHO_API_KEY={os.environ['HONCHO_API_KEY']}' > /home/sprite/.nanobot/.env")
-    ok(f"config.json + .env written ({PROVIDER['name']}/{PROVIDER['model']})")
+    config_json = json.dumps(config, separators=(",", ":"))
+
+    batch.add("mkdir -p /home/sprite/.nanobot/workspace")
+    # config.json holds no secrets, so on a redeploy it is usually unchanged; onboard and
+    # `honcho enable` rewrite the file in their own format, so compare against a sidecar
+    # holding the sha of what we last uploaded rather than hashing config.json itself
+    config_sha = hashlib.sha256(config_json.encode()).hexdigest()
+    r = sprite_exec(
+        "[ -f /home/sprite/.nanobot/config.json ] && cat /home/sprite/.nanobot/.config-sha256",
+        check=False, capture=True,
+    )
+    if r.returncode == 0 and r.stdout.strip() == config_sha:
+        dim("config.json unchanged on sprite, not re-uploading")
+    else:
+        batch.add(write_file("/home/sprite/.nanobot/config.json", config_json))
+        batch.add(write_file("/home/sprite/.nanobot/.config-sha256", config_sha + "\n"))
+    batch.add(write_file("/home/sprite/.nanobot/.env", "".join(f"{k}={v}\n" for k, v in env.items())))
+    ok(f"config queued ({PROVIDER['name']}/{PROVIDER['model']})")
 
 
-def onboard():
+def onboard(batch: SpriteBatch):
     info("Running onboard")
-    sprite_exec(f"""
+    # config.json was just written, so onboard asks whether to overwrite it: answer N
+    # (refresh, keeping our values) so it goes on to create the workspace templates
+    batch.add(f"""
         export HOME=/home/sprite
-        {NANOBOT_BIN} onboard 2>/dev/null || true
+        printf 'n\\n' | {NANOBOT_BIN} onboard > /dev/null
     """)
-    ok("done")
+    ok("queued")
 
 
-def register_service():
+def register_service(batch: SpriteBatch):
     info("Registering nanobot service")
     startup = f"""#!/bin/bash
 set -a
@@ -488,10 +694,10 @@ set +a
 export HOME=/home/sprite
 exec {NANOBOT_BIN} gateway --port 8080
 """
-    sprite_exec(f"cat > /home/sprite/start-nanobot.sh << 'STARTSH'\n{startup}STARTSH\nchmod +x /home/sprite/start-nanobot.sh")
-    sprite("exec", "sprite-env", "services", "create", "nanobot",
-           "--cmd", "bash", "--args", "/home/sprite/start-nanobot.sh", check=False)
-    sprite("exec", "sprite-env", "services", "start", "nanobot", check=False)
+    batch.add(write_file("/home/sprite/start-nanobot.sh", startup) + " && chmod +x /home/sprite/start-nanobot.sh")
+    batch.add("sprite-env services create nanobot --cmd bash --args /home/sprite/start-nanobot.sh || true")
+    batch.add("sprite-env services start nanobot || true")
+    batch.flush("config + onboard + service")
     sprite("url", "update", "--auth", "public", check=False)
     ok("service started")
 
@@ -520,7 +726,7 @@ def summary():
 if __name__ == "__main__":
     import argparse
     p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
-    p.add_argument("--provider", help="Provider name (openrouter, anthropic, openai, deepseek, gemini, groq)")
+    p.add_argument("--provider", help=f"Provider name ({', '.join(PROVIDERS)})")
     p.add_argument("--provider-key", help="API key for the chosen provider")
     p.add_argument("--model", help="Model identifier (e.g. anthropic/claude-sonnet-4-5)")
     p.add_argument("--telegram-token", help="Telegram bot token")
@@ -528,12 +734,10 @@ if __name__ == "__main__":
     args = p.parse_args()
 
     if args.provider:
-        match = [p for p in PROVIDERS if p[0] == args.provider]
-        if not match: fail(f"Unknown provider: {args.provider}")
-        name, env, default_model, desc, url = match[0]
-        PROVIDER.update({"name": name, "env": env, "default_model": default_model, "url": url})
-        if args.provider_key: os.environ[env] = args.provider_key; PROVIDER["key"] = args.provider_key
-        PROVIDER["model"] = args.model or default_model
+        if args.provider not in PROVIDERS: fail(f"Unknown provider: {args.provider}")
+        spec = use_provider(args.provider)
+        if args.provider_key: os.environ[spec.env] = args.provider_key; PROVIDER["key"] = args.provider_key
+        PROVIDER["model"] = args.model or spec.default_model
     if args.telegram_token:
         os.environ["TELEGRAM_BOT_TOKEN"] = args.telegram_token
     if args.honcho_key:
@@ -548,11 +752,13 @@ if __name__ == "__main__":
     collect_keys()
 
     create_sprite()
-    clone_repos()
-    apply_skill()
-    install_uv()
-    install_nanobot()
-    write_config()
-    onboard()
-    register_service()
+    with SpriteShell():
+        batch = SpriteBatch()
+        clone_repos(batch)
+        apply_skill(batch)
+        install_uv(batch)
+        install_nanobot(batch)
+        write_config(batch)
+        onboard(batch)
+        register_service(batch)
     summary()
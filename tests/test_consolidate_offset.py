@@ -99,6 +99,15 @@ class TestSessionImmutableHistory:
         assert len(session.messages) == 3
         assert session.messages[0]["content"] == "msg1"
 
+    def test_add_messages_batch(self) -> None:
+        """Test add_messages appends the whole batch in order."""
+        session = Session(key="test:batch")
+        session.add_message("user", "msg0")
+        session.add_messages([("assistant", "resp0"), ("user", "msg1")])
+        assert [m["content"] for m in session.messages] == ["msg0", "resp0", "msg1"]
+        assert session.messages[1]["role"] == "assistant"
+        assert session.messages[1]["timestamp"] == session.messages[2]["timestamp"]
+
     def test_get_history_returns_most_recent(self) -> None:
         """Test get_history returns the most recent messages."""
         session = Session(key="test:history")